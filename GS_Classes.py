@@ -1,53 +1,257 @@
-import datetime
+import copy
+import numpy as np
 import pandas as pd
 
+
 class Driver:
-    """Drivers have Standard Routes, Bids, and Rejected Routes and traits"""
-    def __init__(self, OriginalBids=[], ID = 0, Hours=0):
-        self.Routes = []  # all routes they currently run at a given point in the program
-        self.OriginalBids = OriginalBids # save all bids, can use for debugging
-        self.ActiveBids = []  # charter bids that have not been rejected
-        self.BidStatus = {} # dictionary of rejection reasons
-        self.ID = ID # Driver ID
-        self.Hours = Hours # Works worked
-        self.Trained = False # Flag if the driver has not had training for SpEd
-        self.SeniorityNumber = None # Seniority Number
-        self.Name = None # Driver Name displayed on tables
-        self.ForceRejectedBids = [] # List of bids we force pre-processing to omit
-    def populate_identification(self, driver_data):
-        """driver_data is a Series of data in the following order: name, ID, seniority number"""
-        self.Name = driver_data.FullName
-        self.ID = driver_data.DriverID
-        try:
-            test = float(driver_data.SeniorityNumber) + 1
-        except:
-            return "Seniority List contains a seniority number that is not a number"
-        self.SeniorityNumber = driver_data.SeniorityNumber
-        return
+    """
+    Drivers have Standard Routes, Bids, and Rejected Routes and traits
+    A Driver is a view of row index of the driver arrays of an AllocationModel, which holds the data of every driver
+    """
+    __slots__ = ('model', 'index')
+    Trained = False  # Flag if the driver has not had training for SpEd
+
+    def __init__(self, model, index):
+        self.model = model
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, Driver) and self.model is other.model and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.model), self.index))
+
+    @property
+    def ID(self):
+        return self.model.driver_ids[self.index]  # Driver ID
+
+    @property
+    def Name(self):
+        return self.model.driver_names[self.index]  # Driver Name displayed on tables
+
+    @property
+    def SeniorityNumber(self):
+        return self.model.seniority_numbers[self.index]
+
+    @property
+    def Hours(self):
+        return float(self.model.driver_hours[self.index])  # Hours worked
+
+    @property
+    def AssignedCharters(self):
+        """
+        Charter routes assigned to the driver, in the order they were assigned (the driver's standard routes are not
+        included, see StandardTimes)
+        """
+        return [Route(self.model, c) for c in self.model.assignments()[0][self.index]]
+
+    @property
+    def StandardTimes(self):
+        """Start and end of every standard route interval of the driver (minutes from the start of the week)"""
+        std = slice(self.model.std_ptr[self.index], self.model.std_ptr[self.index + 1])
+        return list(zip(self.model.std_start[std].tolist(), self.model.std_end[std].tolist()))
+
+    @property
+    def OriginalBids(self):
+        """All bids, in preference order"""
+        return [Route(self.model, c) for c in self.model.bid_charter[self._bids()].tolist()]
+
+    @property
+    def ActiveBids(self):
+        """Charter bids that have not been rejected or assigned"""
+        bids = self._bids()
+        return [Route(self.model, c) for c in self.model.bid_charter[bids][self.model.bid_active[bids]].tolist()]
+
+    @property
+    def BidStatus(self):
+        """Dictionary of route ID to the outcome of the bid, for the bids that have one"""
+        bids = self._bids()
+        decided = self.model.bid_status[bids] != NO_DECISION
+        positions = np.arange(bids.start, bids.stop)[decided]
+        return dict(zip(self.model.charter_ids[self.model.bid_charter[positions]], self.model.status_text(positions)))
+
+    @property
+    def ForceRejectedBids(self):
+        """List of bids pre-processing was forced to omit"""
+        bids = self._bids()
+        rejected = self.model.bid_status[bids] == FORCE_REJECTED
+        return [Route(self.model, c) for c in self.model.bid_charter[bids][rejected].tolist()]
+
+    def _bids(self):
+        return slice(self.model.bid_ptr[self.index], self.model.bid_ptr[self.index + 1])
 
 
 class Route:
-    """Routes have specific days, start time and end time. There are traits like required training and equipment"""
-    def __init__(self, ID = 0, capacity = 0, hours=0):
-        self.ActiveTimes = []
-        self.Hours = hours
-        self.ID = ID
-        self.RequiresTraining = False
-        self.equipment = False
-        # Number of drivers for a route
-        self.capacity = capacity
+    """
+    Routes have specific days, start time and end time. There are traits like required training and equipment
+    A Route is a view of row index of the charter arrays of an AllocationModel, which holds the data of every charter
+    Times are minutes from the start of the week (Sunday 00:00)
+    """
+    __slots__ = ('model', 'index')
+    RequiresTraining = False
+    Standard = False  # whether the route is a standard (school) route or a charter
+
+    def __init__(self, model, index):
+        self.model = model
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, Route) and self.model is other.model and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.model), self.index))
+
+    @property
+    def ID(self):
+        return self.model.charter_ids[self.index]
+
+    @property
+    def capacity(self):
+        return int(self.model.charter_capacity[self.index])  # Number of drivers still needed for the route
+
+    @property
+    def Hours(self):
+        return float(self.model.charter_hours[self.index])
+
+    @property
+    def Start(self):
+        return int(self.model.charter_start[self.index])
+
+    @property
+    def End(self):
+        return int(self.model.charter_end[self.index])
+
+    @property
+    def ActiveTimes(self):
+        """Start and end of the route, closed on both ends"""
+        return self.Start, self.End
+
+    @property
+    def AssignedDrivers(self):
+        """IDs of the drivers assigned to the route, in the order they were assigned"""
+        return [self.model.driver_ids[d] for d in self.model.assignments()[1][self.index]]
+
+
+# Outcome of a bid, stored as a code in AllocationModel.bid_status (and the iteration in bid_iteration for the
+# outcomes that have one). The text is only written out for diagnostics and display, see AllocationModel.status_text()
+NO_DECISION, RECEIVED, ROUTE_TAKEN, HOUR_LIMIT, SAME_DAY, TIME_CONFLICT, FORCE_REJECTED, NOT_TRAINED = range(8)
+STATUS_TEXT = (
+    'No Decision',
+    'Received Bid on iteration {}',
+    'Route already assigned on iteration {}',
+    'Hour Limit Exceeded',
+    'Already received bid on same day',
+    'Time Conflict',
+    'Force Rejected',
+    'Not SpEd trained',
+)
+
+
+class AllocationModel:
+    """
+    Array-backed state of one allocation run, used by pre-processing, deferred acceptance and post-processing.
+    Drivers and charters are dense integers (their row in the seniority list and the charter list).
+    Bids are stored CSR-style: the bids of driver d are bid_charter[bid_ptr[d]:bid_ptr[d + 1]] in preference order,
+    and the standard route times of driver d are std_start/std_end[std_ptr[d]:std_ptr[d + 1]].
+    Times are minutes from the start of the week (Sunday 00:00), intervals are closed on both ends.
+    """
+    def __init__(self, driver_ids, driver_names, seniority_numbers, driver_hours, driver_rank,
+                 std_ptr, std_start, std_end,
+                 charter_ids, charter_capacity, charter_hours, charter_start, charter_end, charter_day,
+                 bid_ptr, bid_charter):
+        # Drivers
+        self.driver_ids = np.asarray(driver_ids, dtype=object)
+        self.driver_names = np.asarray(driver_names, dtype=object)
+        self.seniority_numbers = np.asarray(seniority_numbers, dtype=object)
+        self.driver_hours = np.array(driver_hours, dtype=np.float64)  # standard route hours plus assigned charters
+        self.driver_rank = np.asarray(driver_rank, dtype=np.int32)  # position on the rotated seniority list
+        self.driver_index = {driver_id: d for d, driver_id in enumerate(self.driver_ids)}
+
+        # Standard route times for each driver
+        self.std_ptr = np.asarray(std_ptr, dtype=np.int64)
+        self.std_start = np.asarray(std_start, dtype=np.int64)
+        self.std_end = np.asarray(std_end, dtype=np.int64)
+
+        # Charters
+        self.charter_ids = np.asarray(charter_ids, dtype=object)
+        self.charter_capacity = np.array(charter_capacity, dtype=np.int32)  # buses still to be assigned
+        self.charter_hours = np.asarray(charter_hours, dtype=np.float64)
+        self.charter_start = np.asarray(charter_start, dtype=np.int64)
+        self.charter_end = np.asarray(charter_end, dtype=np.int64)
+        self.charter_day = np.asarray(charter_day, dtype=np.int64)  # day of the week the charter starts on
+        self.charter_index = {charter_id: c for c, charter_id in enumerate(self.charter_ids)}
+
+        # Bids, one entry per (driver, charter) bid
+        self.bid_ptr = np.asarray(bid_ptr, dtype=np.int64)
+        self.bid_charter = np.asarray(bid_charter, dtype=np.int32)
+        self.bid_driver = np.repeat(np.arange(len(self.driver_ids), dtype=np.int32), np.diff(self.bid_ptr))
+        self.bid_active = np.ones(len(self.bid_charter), dtype=bool)  # bids that have not been rejected or assigned
+        self.bid_status = np.zeros(len(self.bid_charter), dtype=np.uint8)  # outcome of each bid (status code)
+        self.bid_iteration = np.zeros(len(self.bid_charter), dtype=np.int16)  # iteration of the outcome, if it has one
+        # Bids by charter: the bids on charter c are charter_bids[charter_bid_ptr[c]:charter_bid_ptr[c + 1]],
+        # in driver order. Bids are never added, so removed bids are simply skipped using bid_active
+        self.charter_bids = np.argsort(self.bid_charter, kind='stable')
+        self.charter_bid_ptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.bid_charter, minlength=len(self.charter_ids)))])
+        # Bids by driver and day: the bids of driver d on charters starting on day k are
+        # day_bids[day_bid_ptr[7 * d + k]:day_bid_ptr[7 * d + k + 1]]
+        day_key = 7 * self.bid_driver.astype(np.int64) + self.charter_day[self.bid_charter]
+        self.day_bids = np.argsort(day_key, kind='stable')
+        self.day_bid_ptr = np.concatenate([[0], np.cumsum(np.bincount(day_key, minlength=7 * len(self.driver_ids)))])
+        # Bids by driver and hours: the bids of driver d from fewest to most charter hours are
+        # hour_bids[bid_ptr[d]:bid_ptr[d + 1]], with those hours in hour_sorted. The bids of driver d from
+        # hour_cut[d] on have been removed by the hour limit
+        self.hour_bids = np.lexsort((self.charter_hours[self.bid_charter], self.bid_driver))
+        self.hour_sorted = self.charter_hours[self.bid_charter[self.hour_bids]]
+        self.hour_cut = self.bid_ptr[1:].copy()
 
-        # If we need to delineate between there and back, might want to use:
-        # self.num_bus_there = 0
-        # self.num_bus_back = 0
-        # self.size_there = 0
-        # self.size_back = 0
-        self.DropPick = False  # whether a route is one leg of a combined drop and pick route
-        self.Lunch = False  # whether there's lunch during the route
-        self.Standard = False  # whether the route is a standard (school) route or a charter
-        self.AssignedDrivers = []
+        # Assignments (driver index, charter index) in the order they were made
+        self.assigned_driver = []
+        self.assigned_charter = []
+        self._assignments = None
 
+    @property
+    def n_drivers(self):
+        return len(self.driver_ids)
 
+    @property
+    def n_charters(self):
+        return len(self.charter_ids)
 
+    def copy(self):
+        """
+        Returns a copy of the model that can be allocated on its own. The arrays that change during an allocation
+        are copied, the rest (driver, charter and bid data and the indexes) are shared with this model
+        """
+        model = copy.copy(self)
+        for name in ('driver_hours', 'charter_capacity', 'bid_active', 'bid_status', 'bid_iteration', 'hour_cut'):
+            setattr(model, name, getattr(self, name).copy())
+        model.assigned_driver = list(self.assigned_driver)
+        model.assigned_charter = list(self.assigned_charter)
+        model._assignments = None
+        return model
 
+    def status_text(self, bids):
+        """
+        Returns the text of the outcome of bids (positions in the bid arrays) as a Categorical, so each distinct
+        text is only stored once
+        """
+        key = self.bid_status[bids].astype(np.int64) * 65536 + self.bid_iteration[bids]
+        # each distinct (status, iteration) pair is formatted once
+        pairs, inverse = np.unique(key, return_inverse=True)
+        text = [STATUS_TEXT[pair // 65536].format(pair % 65536) for pair in pairs.tolist()]
+        return pd.Categorical.from_codes(inverse.reshape(-1), text)
 
+    def assignments(self):
+        """
+        Returns the charters assigned to each driver and the drivers assigned to each charter (lists of indexes,
+        in the order they were assigned), rebuilt only when assignments were made since the last call
+        """
+        if self._assignments is None or self._assignments[0] != len(self.assigned_driver):
+            driver_routes = [[] for _ in range(self.n_drivers)]
+            charter_drivers = [[] for _ in range(self.n_charters)]
+            for d, c in zip(self.assigned_driver, self.assigned_charter):
+                driver_routes[d].append(c)
+                charter_drivers[c].append(d)
+            self._assignments = len(self.assigned_driver), driver_routes, charter_drivers
+        return self._assignments[1:]
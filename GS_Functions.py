@@ -1,378 +1,874 @@
-from datetime import datetime, timedelta
+from bisect import bisect_right
+import io
+import zlib
 import GS_Classes as gsc
+import numpy as np
 import pandas as pd
 
 dow_to_day = {'U': 0, 'M': 1, 'T': 2, 'W': 3, 'R': 4, 'F': 5,
               'S': 6}
 inv_dow_to_day = {v: k for k, v in dow_to_day.items()}
+MINUTES_PER_DAY = 24 * 60
+FORM_BID_SLOTS = 50  # number of bid spots in the intake form, used if the bid columns are not numbered
 
 
-def route_conflicts(route, all_intervals):
+def route_conflicts(drivers, starts, ends, std_ptr, std_start, std_end):
     """
     Helper function for route_time_conflicts()
-    Check whether any time interval in a Route conflicts with any time interval in the current assigned Routes
+    Input: driver, start and end minutes of each bid, standard route times of every driver (CSR, see AllocationModel)
+    Output: boolean array, True where a bid conflicts with any of its driver's standard route times (closed intervals)
+    Sweeps all bids at once: standard route times are sorted by (driver, start) with a running maximum of their ends,
+    so for each bid one binary search finds the latest end among its driver's route times starting before the bid ends
+    """
+    if len(std_start) == 0 or len(starts) == 0:
+        return np.zeros(len(starts), dtype=bool)
+    # Encode (driver, minute) as one sortable key, each driver gets its own block of span minutes
+    lo = min(std_start.min(), starts.min())
+    span = max(std_end.max(), ends.max()) - lo + 1
+    std_driver = np.repeat(np.arange(len(std_ptr) - 1, dtype=np.int64), np.diff(std_ptr))
+    std_key = std_driver * span + (std_start - lo)
+    order = np.argsort(std_key, kind='stable')
+    std_key = std_key[order]
+    # Running maximum of the route ends, the blocks of earlier drivers are always lower so it never leaks across drivers
+    latest_end = np.maximum.accumulate(std_driver[order] * span + (std_end[order] - lo))
+    block = drivers.astype(np.int64) * span
+    last = np.searchsorted(std_key, block + (ends - lo), side='right') - 1
+    return (last >= 0) & (latest_end[np.maximum(last, 0)] >= block + (starts - lo))
+
+
+def route_time_conflicts(model):
     """
-    if route.ActiveTimes is list:
-        intervals = route.ActiveTimes
-    else:
-        intervals = [route.ActiveTimes]
-    return any(all_intervals.overlaps(iv).any() for iv in intervals)
+    Removes invalid bids based on time conflicts with already assigned Routes
+    """
+    bids = np.flatnonzero(model.bid_active)
+    charters = model.bid_charter[bids]
+    conflicts = bids[route_conflicts(model.bid_driver[bids], model.charter_start[charters], model.charter_end[charters],
+                                     model.std_ptr, model.std_start, model.std_end)]
+    model.bid_active[conflicts] = False
+    model.bid_status[conflicts] = gsc.TIME_CONFLICT
 
 
-def route_time_conflicts(driver):
+def add_force_rejects(model, force_reject_tuples):
     """
-    Removes invalid bids based on time conflicts with already assigned Routes
+    Input: AllocationModel and tuples of driver ID, route ID force rejects
+    Output: None but marks the drivers' bids on those routes as force rejected and removes them from the active bids
+    Pairs that do not match an active bid are ignored
     """
-    valid_bids = []
-    all_route_intrv_list = []
-    if not driver.Routes:
-        # print('empty')
-        return 0
-    for r in driver.Routes:
-        all_route_intrv_list.extend(r.ActiveTimes)
-    all_route_interval = pd.IntervalIndex(all_route_intrv_list)
-    for bid in driver.ActiveBids:
-        # print(bid.ActiveTimes)
-        if not route_conflicts(bid, all_route_interval):
-            valid_bids.append(bid)
-        else:
-            driver.BidStatus[bid.ID] = 'Time Conflict'
-    driver.ActiveBids = valid_bids
+    rejects = pd.DataFrame(list(force_reject_tuples), columns=['DriverID', 'RouteID'])
+    d = pd.Index(model.driver_ids).get_indexer(rejects['DriverID'])
+    c = pd.Index(model.charter_ids).get_indexer(rejects['RouteID'])
+    known = (d >= 0) & (c >= 0)
+    # every (driver, charter) pair as one integer key, matched against the bids in one pass
+    reject_key = d[known].astype(np.int64) * model.n_charters + c[known]
+    bid_key = model.bid_driver.astype(np.int64) * model.n_charters + model.bid_charter
+    rejected = np.flatnonzero(model.bid_active & np.isin(bid_key, reject_key))
+    model.bid_active[rejected] = False
+    model.bid_status[rejected] = gsc.FORCE_REJECTED
 
 
-def add_force_rejects(driver_id, route_id, driver_id_to_driver_object, charter_id_to_route_object):
+def csr_ranges(starts, ends):
     """
-    Input: Driver ID and Route ID, driver ID to object dictionary, charter route ID to object dictionary
-    Output: None but adds force rejected bids to attribute and removes them from ActiveBids
+    Helper for the CSR-style indexes of the AllocationModel
+    Input: Start and end positions of some ranges
+    Output: Positions from starts[i] up to (not including) ends[i] for every range, range by range
     """
-    driver = driver_id_to_driver_object[driver_id]
-    ob = driver.OriginalBids.copy()  # For some reason OriginalBids gets overwritten somewhere so this stops that
-    driver.ForceRejectedBids.append(charter_id_to_route_object[route_id])
-    driver.ActiveBids.remove(charter_id_to_route_object[route_id])
-    driver.BidStatus[route_id] = 'Force Rejected'
-    driver.OriginalBids = ob
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
 
 
-def hour_limits(driver, max_hrs):
+def csr_rows(ptr, rows):
     """
-    Removes invalid bids based on hour limits given a Driver and a limit on hours (set globally in frontend)
+    Helper for the CSR-style indexes of the AllocationModel
+    Input: Row pointer array and the rows to read
+    Output: Positions of all entries in those rows, row by row
     """
-    valid_bids = []
-    for bid in driver.ActiveBids:
-        if driver.Hours + bid.Hours <= max_hrs:
-            valid_bids.append(bid)
-        else:
-            driver.BidStatus[bid.ID] = 'Hour Limit Exceeded'
-    driver.ActiveBids = valid_bids
+    rows = np.asarray(rows, dtype=np.int64)
+    return csr_ranges(ptr[rows], ptr[rows + 1])
 
 
-def qualifications(driver):
+def hour_limits(model, max_hrs, drivers=None):
+    """
+    Removes invalid bids based on hour limits given the AllocationModel and a limit on hours (set globally in frontend)
+    Each driver's bids are kept ordered by hours (model.hour_bids), so the bids over the limit are the tail found by
+    one bisect, and only the part of the tail that was not cut off before is marked
+    Only the bids of drivers are checked if given (drivers whose hours changed), otherwise the bids of all drivers
+    """
+    drivers = range(model.n_drivers) if drivers is None else np.asarray(drivers).tolist()
+    bid_ptr, hour_cut, hour_sorted = model.bid_ptr, model.hour_cut, model.hour_sorted
+    old_cuts, new_cuts = [], []
+    for d in drivers:
+        hours = model.driver_hours[d]
+        old_cut = hour_cut[d]
+        new_cut = bisect_right(hour_sorted, max_hrs, bid_ptr[d], old_cut, key=lambda bid_hours: hours + bid_hours)
+        if new_cut < old_cut:
+            hour_cut[d] = new_cut
+            old_cuts.append(old_cut)
+            new_cuts.append(new_cut)
+    over = model.hour_bids[csr_ranges(new_cuts, old_cuts)]
+    over = over[model.bid_active[over]]
+    model.bid_active[over] = False
+    model.bid_status[over] = gsc.HOUR_LIMIT
+
+
+def qualifications(model, trained, requires_training):
     """
     Checks if Driver does not have SpEd training.
     If Driver does not, it removes any bids for that do require SpEd training.
+    trained: boolean array over drivers, requires_training: boolean array over charters
     Not currently used
     """
-    training = driver.Trained
-    valid_bids = []
-    for route in driver.ActiveBids:
-        if not route.RequiresTraining:
-            valid_bids.append(route)
-        elif route.RequiresTraining and training:
-            valid_bids.append(route)
-        else:
-            driver.BidStatus[route.ID] = 'Not SpEd trained'
-    driver.ActiveBids = valid_bids
+    untrained = np.flatnonzero(model.bid_active & requires_training[model.bid_charter] & ~trained[model.bid_driver])
+    model.bid_active[untrained] = False
+    model.bid_status[untrained] = gsc.NOT_TRAINED
 
 
-def pre_processing(driver_list, max_hrs, driver_id_to_driver_object, charter_id_to_route_object, force_reject_tuples=None):
+def pre_processing(model, max_hrs, force_reject_tuples=None):
     """
-    Input: List of Driver, maximum hours per week a driver can work, tuples of driver ID,
-            route ID force rejects, driver ID to object dictionary, charter route ID to object dictionary
+    Input: AllocationModel, maximum hours per week a driver can work, tuples of driver ID, route ID force rejects
     Output: None but calls all pre-processing subcomponents
     """
     if force_reject_tuples is not None:
-        for driver_ID, route_ID in force_reject_tuples:
-            add_force_rejects(driver_ID, route_ID, driver_id_to_driver_object, charter_id_to_route_object)
-    for driver in driver_list:
-        route_time_conflicts(driver)
-        hour_limits(driver, max_hrs)
-        # qualifications(driver)
+        add_force_rejects(model, force_reject_tuples)
+    route_time_conflicts(model)
+    hour_limits(model, max_hrs)
+    # qualifications(model, trained, requires_training)
 
 
-def create_time_intervals(route_data, padding):
+def read_csv_file(path):
     """
-    Input: route_data, row from the current format of Bytecurve export and padding parameter (set globally in frontend)
-    Output: Returns a list of all times that the route is active, for all days of the week
-    Times are encoded as timedeltas relative to the start of the week (Sunday-Saturday)
-    EX: Monday noon is 1 day 12 hours
+    Input: Path of an input csv
+    Output: DataFrame of the file, falling back to the ISO-8859-1 encoding some Excel exports use
     """
-    # converts exported DOW codes to numbers for timedelta
+    try:
+        return pd.read_csv(path)
+    except UnicodeDecodeError:
+        return pd.read_csv(path, encoding="ISO-8859-1")
+
+
+def force_reject_list(force_reject_data):
+    """
+    Input: Force rejections DataFrame (columns DriverID, RouteID) or None
+    Output: List of (DriverID, RouteID) tuples for gale_shapley_main(), or None
+    """
+    if force_reject_data is None:
+        return None
+    # Make it so all entries are ints, not strings
+    return list(force_reject_data[['DriverID', 'RouteID']].astype(int).itertuples(index=False, name=None))
+
+
+def create_time_intervals(route_data, padding):
+    """
+    Input: route_data, standard routes in the current format of Bytecurve export (columns RouteID, DriverID, DOW,
+        DepartureTime, ReturnTime) and padding parameter (set globally in frontend)
+    Output: Interval table with one row per route per day of the week it is active:
+        RouteID, DriverID, Day, StartMin, EndMin (padded times used for time conflicts), Hours (unpadded)
+    Times are encoded as minutes relative to the start of the week (Sunday-Saturday)
+    EX: Monday noon is 1 * 1440 + 720
+    """
+    dep = pd.to_datetime(route_data['DepartureTime'], format="%I:%M %p")
+    ret = pd.to_datetime(route_data['ReturnTime'], format="%I:%M %p")
+    dep_min = (dep.dt.hour * 60 + dep.dt.minute).to_numpy(np.int64)
+    ret_min = (ret.dt.hour * 60 + ret.dt.minute).to_numpy(np.int64)
+    backwards = ret_min < dep_min
+    if backwards.any():
+        raise ValueError(f"Depot return time is before departure time for route(s) "
+                         f"{route_data['RouteID'][backwards].to_list()}")
+
+    # converts exported DOW codes to numbers, one row per day the route runs
     # U = Sunday, update based on actual Bytecurve DOW codes if needed
-    intrvs = []
-    hours = []
-    dep = route_data['DepartureTime']
-    dep_abs = datetime.strptime(dep, "%I:%M %p").strftime('%H:%M')
-    dep_t = pd.to_datetime(dep_abs, format='%H:%M')
-
-    ret = route_data['ReturnTime']
-    ret_abs = datetime.strptime(ret, "%I:%M %p").strftime('%H:%M')
-    ret_t = pd.to_datetime(ret_abs, format='%H:%M')
-
-    for char in route_data['DOW']:
-        start = pd.Timedelta(days=dow_to_day[char]) + pd.to_timedelta(dep_t.hour, unit='h') + pd.to_timedelta(
-            dep_t.minute, unit='m')
-        end = pd.Timedelta(days=dow_to_day[char]) + pd.to_timedelta(ret_t.hour, unit='h') + pd.to_timedelta(
-            ret_t.minute, unit='m')
-        hours.append(pd.Interval(start, end, closed='both').length.seconds / 3600)
-
-        pad_start = start + pd.Timedelta(minutes = int(padding))
-        pad_end = end - pd.Timedelta(minutes=int(padding))
-        if pad_start < pad_end:
-            intrvs.append(pd.Interval(pad_start, pad_end, closed = 'both'))
-        else:  # handle if route time is too short to pad properly
-            mid = start + (end - start)/2
-            intrvs.append(pd.Interval(mid, mid + pd.Timedelta(minutes = 1), closed='both'))
-    return intrvs, sum(hours)
+    dow = route_data['DOW'].astype(str).to_list()
+    row = np.repeat(np.arange(len(dow)), [len(codes) for codes in dow])
+    day = pd.Series(list(''.join(dow))).map(dow_to_day)
+    if day.isna().any():
+        raise KeyError(f"Unknown day of the week code(s) in standard routes: {sorted(set(''.join(dow)) - set(dow_to_day))}")
+    day = day.to_numpy(np.int64)
+
+    start = day * MINUTES_PER_DAY + dep_min[row]
+    end = day * MINUTES_PER_DAY + ret_min[row]
+    pad_start = start + int(padding)
+    pad_end = end - int(padding)
+    # handle if route time is too short to pad properly: one minute from the midpoint, rounded inwards to whole minutes
+    too_short = pad_start >= pad_end
+    return pd.DataFrame({
+        'RouteID': route_data['RouteID'].to_numpy()[row],
+        'DriverID': route_data['DriverID'].to_numpy()[row],
+        'Day': day,
+        'StartMin': np.where(too_short, (start + end + 1) // 2, pad_start),
+        'EndMin': np.where(too_short, (start + end) // 2 + 1, pad_end),
+        'Hours': (end - start) / 60,
+    })
 
 
 def read_standard_routes(data, padding):
     """
     Helper for initialize()
     Input: Bytecurve standard routes export
-    Output: List of all standard routes, dictionary mapping standard route IDs to driver IDs
+    Output: Interval table of all standard routes (see create_time_intervals())
     """
-    standard_routes = []
-    standard_routes_to_drivers = dict()
-    data_clean = data[['Employee', 'Days of the week', 'Depot departure time', 'Depot return time']]
-    data_clean.reset_index(inplace=True)
+    data_clean = data[['Employee', 'Days of the week', 'Depot departure time', 'Depot return time']].reset_index()
     data_clean.columns = ['RouteID', 'DriverID', 'DOW', 'DepartureTime', 'ReturnTime']
-    for _, row in data_clean.iterrows():
-        tmp = gsc.Route(ID=row.RouteID)
-        tmp.Standard = True
-        intrvs, hours = create_time_intervals(row, padding)
-        tmp.ActiveTimes = intrvs
-        tmp.Hours = hours
-        standard_routes.append(tmp)
-        standard_routes_to_drivers[row.RouteID] = row.DriverID
-    return standard_routes, standard_routes_to_drivers
+    return create_time_intervals(data_clean, padding)
 
 
 def read_seniority_data(data):
     """
     Helper for initialize()
     Input: Seniority DataFrame in specified format (see templates)
-    Output: List of all drivers, dictionary mapping driver IDs to Driver objects
+    Output: Driver table with one row per driver: DriverID, Name, SeniorityNumber, Hours (0 until standard routes are
+        added), or an error message if a seniority number is not a number
     """
-    drivers = []
-    id_to_drivers = dict()
-    for _, row in data.iterrows():
-        tmp = gsc.Driver()
-        val = tmp.populate_identification(row)
-        if val:
-            return None, val
-        drivers.append(tmp)
-        id_to_drivers[row.DriverID] = tmp
-    return drivers, id_to_drivers
+    not_number = pd.to_numeric(data['SeniorityNumber'], errors='coerce').isna() & data['SeniorityNumber'].notna()
+    if not_number.any():
+        return "Seniority List contains a seniority number that is not a number"
+    return pd.DataFrame({
+        'DriverID': data['DriverID'].to_numpy(),
+        'Name': data['FullName'].to_numpy(),
+        'SeniorityNumber': data['SeniorityNumber'].to_numpy(),
+        'Hours': np.zeros(len(data)),
+    })
 
 
-def assign_standard_routes_to_drivers(routes, id_to_drivers, routes_to_drivers):
+def seniority_rank_table(seniority_data, sen_num):
+    """
+    Input: Seniority DataFrame in specified format (see templates), seniority number of the last allocation
+    Output: Dictionary mapping driver IDs to their rank on every charter (0 is most preferred)
+    The seniority list is rotated so the driver after the last allocation is ranked first
+    """
+    driver_ids = seniority_data['DriverID'].to_list()
+    if sen_num != 0:
+        driver_ids = driver_ids[sen_num:] + driver_ids[:sen_num]
+    return {driver_id: rank for rank, driver_id in enumerate(driver_ids)}
+
+
+def assign_standard_routes_to_drivers(std_intervals, driver_table):
     """
     Helper for initialize()
-    Input: List of routes, dictionary mapping driver IDs to Driver objects, dictionary mapping route IDs to driver IDs
-    Output: None but adds routes to corresponding Driver's Routes attribute
+    Input: Interval table of standard routes, driver table (see read_seniority_data())
+    Output: None but adds the hours of each route to the corresponding driver's Hours
     """
-    for route in routes:
-        driver_id = routes_to_drivers[route.ID]
-        driver = id_to_drivers[driver_id]
-        driver.Routes.append(route)
-        driver.Hours += route.Hours
+    # Each route's hours are summed over its days first, then added to its driver in the order of the export
+    route = pd.factorize(std_intervals['RouteID'])[0]
+    route_hours = np.bincount(route, weights=std_intervals['Hours'].to_numpy())
+    _, first_row = np.unique(route, return_index=True)
+    driver_index = {driver_id: d for d, driver_id in enumerate(driver_table['DriverID'])}
+    route_driver = [driver_index[driver_id] for driver_id in std_intervals['DriverID'].to_numpy()[first_row]]
+    hours = driver_table['Hours'].to_numpy(np.float64, copy=True)
+    np.add.at(hours, route_driver, route_hours)
+    driver_table['Hours'] = hours
 
 
 def initialize(standard_routes_data, seniority_data, padding):
     """
     Input: Standard Routes data, seniority data
-    Output: List of all standard routes, dictionary mapping standard route IDs to drivers,
-        List of all drivers, dictionary mapping driver IDs to Driver objects
+    Output: Interval table of all standard routes and driver table with standard route hours (see read_seniority_data()),
+        or None and an error message
     """
     #try:
-    std_routes, std_routes_to_drivers = read_standard_routes(standard_routes_data, padding)
+    std_intervals = read_standard_routes(standard_routes_data, padding)
     #except Exception as e:
-    #    return (None, None, None,"Bytecurve import for standard routes does not match expected input data types. P/U and Dropoff columns need to be datetime in Excel. "
+    #    return (None, None,"Bytecurve import for standard routes does not match expected input data types. P/U and Dropoff columns need to be datetime in Excel. "
     #    "Check columns are consistent.")
-    drivers, id_to_drivers = read_seniority_data(seniority_data)
-    #if drivers is None:
-    #    return None,None,None,"Seniority List contains a seniority number that is not a number"
+    driver_table = read_seniority_data(seniority_data)
+    if isinstance(driver_table, str):
+        return None, driver_table
     #try:
-    assign_standard_routes_to_drivers(std_routes, id_to_drivers, std_routes_to_drivers)
+    assign_standard_routes_to_drivers(std_intervals, driver_table)
     #except Exception as e:
-    #    return None, None, None, "Some unknown issue occured while reading static routes and/or seniority list"
-    return std_routes, std_routes_to_drivers, drivers, id_to_drivers
+    #    return None, None, "Some unknown issue occured while reading static routes and/or seniority list"
+    return std_intervals, driver_table
 
 
-def get_charter_interval(row):
+def get_charter_interval(day, pickup, ret):
     """
-    Helper function for read_charters()
-    Input: Takes in a charter (row) from the charter data (see template for format)
-    Output: Returns an interval corresponding to the active time of the trip and the hours of the trip
+    Helper function for read_charters_routes()
+    Input: Day of the week of each trip, pick-up and return times of each trip (datetime Series)
+    Output: Start and end of each trip in minutes relative to the start of the week and the hours of each trip
+    A return time at or before the pick-up time is on the next day (overnight trips, a 24 hour trip if equal)
     """
-    start = (pd.Timedelta(days=dow_to_day[row['Trip DOW']]) + pd.to_timedelta(row['P/U Time'].hour, unit='h')
-             + pd.to_timedelta(row['P/U Time'].minute, unit='m'))
-    end = (pd.Timedelta(days=dow_to_day[row['Trip DOW']]) + pd.to_timedelta(row['Return Time'].hour, unit='h')
-           + pd.to_timedelta(row['Return Time'].minute, unit='m'))
-    if start >= end:  # correction for overnights
-        end = (pd.Timedelta(days=dow_to_day[row['Trip DOW']] + 1) + pd.to_timedelta(row['Return Time'].hour, unit='h')
-               + pd.to_timedelta(row['Return Time'].minute, unit='m'))
-    return pd.Interval(start, end, closed='both'), pd.Interval(start, end, closed='both').length.seconds / 3600
+    day = np.asarray(day, dtype=np.int64)
+    pickup, ret = pickup.dt, ret.dt
+    start = day * MINUTES_PER_DAY + (pickup.hour * 60 + pickup.minute).to_numpy(np.int64)
+    end = day * MINUTES_PER_DAY + (ret.hour * 60 + ret.minute).to_numpy(np.int64)
+    end = np.where(start >= end, end + MINUTES_PER_DAY, end)  # correction for overnights
+    return start, end, (end - start) / 60
 
 
 def dow_converter(dow):
     """
-    Helper function for DOW conversion
+    Helper function for DOW conversion, pandas counts days from Monday and the week here starts on Sunday
     """
-    return dow + 1 if dow + 1 < 7 else 0
+    return (dow + 1) % 7
 
 
 def read_charters_routes(charter_data):
     """
     Input: Reads charters (rows) from the charter data (see template for format)
-    Output: Returns a list of Route objects with charter information filled in
-        and a dictionary mapping the route ID to the Route object
+    Output: Charter table with one row per charter:
+        RouteID, Capacity (buses), Day, StartMin, EndMin (minutes relative to the start of the week), Hours
+    charter_data itself is not changed
     """
-    charter_id_to_routes = dict()
-    charter_data['P/U Time'] = charter_data['P/U Time'].apply(lambda x: pd.to_datetime(x, format='%H:%M:%S'))
-    charter_data['Return Time'] = charter_data['Return Time'].apply(
-        lambda x: pd.to_datetime(x, format='%H:%M:%S'))
-    charter_data['Trip DOW'] = charter_data['Trip Date'].apply(
-        lambda x: inv_dow_to_day[dow_converter(pd.Timestamp(x).dayofweek)])
+    pickup = pd.to_datetime(charter_data['P/U Time'], format='%H:%M:%S')
+    ret = pd.to_datetime(charter_data['Return Time'], format='%H:%M:%S')
+    try:
+        trip_date = pd.to_datetime(charter_data['Trip Date'])
+    except (ValueError, TypeError):
+        # dates written in more than one format
+        trip_date = pd.to_datetime(charter_data['Trip Date'], format='mixed')
+    day = dow_converter(trip_date.dt.dayofweek)
 
-    charter_routes = []
-    for ind, row in charter_data.iterrows():
-        tmp = gsc.Route()
-        tmp.capacity = row.Buses
-        tmp.ID = row['Trip Number']
-        charter_id_to_routes[tmp.ID] = tmp
-        time, hours = get_charter_interval(row)
-        tmp.Hours = hours
-        tmp.ActiveTimes = time
-        charter_routes.append(tmp)
-    return charter_routes, charter_id_to_routes
+    start, end, hours = get_charter_interval(day, pickup, ret)
+    return pd.DataFrame({
+        'RouteID': charter_data['Trip Number'].to_numpy(),
+        'Capacity': charter_data['Buses'].to_numpy(),
+        'Day': day.to_numpy(np.int64),
+        'StartMin': start,
+        'EndMin': end,
+        'Hours': hours,
+    })
 
 
-def read_charter_bids(id_to_drivers, form_data, charter_id_to_routes):
+def bid_columns(form_data):
     """
-    Input: Takes in the driver ID to Driver dict, the form DataFrame and the charter ID to charter Route dict
-    Output: Assigns the bids in order to each Driver object
+    Helper for read_charter_bids() and the validation of the bid form
+    Output: The bid spot columns of the form, the columns numbered 1, 2, ... or the last FORM_BID_SLOTS columns if
+        there are none
     """
-    for ind, row in form_data.iterrows():
-        tmp = id_to_drivers[row.Id]
-        pref = row[-50:].dropna().to_list()  # 50 is hardcoded based off the number of bid spots in the intake form
-        pref_route_objects = [charter_id_to_routes[r] for r in pref]
-        tmp.OriginalBids = pref_route_objects
-        tmp.ActiveBids = pref_route_objects
+    columns = [col for col in form_data.columns if str(col).strip().isdigit()]
+    if not columns:
+        columns = form_data.columns[-FORM_BID_SLOTS:]
+    return columns
 
 
-def assigned_bids(new_routes, driver_matches, iteration, bids_assigned, route_prefs):
+def read_charter_bids(driver_table, form_data, charter_table):
     """
-    Add routes to the driver's current routes
-    new_routes: dictionary of routes that have been assigned in GS iteration
-    driver_matches: dictionary of driver id to driver objects
-    iteration: number of iterations
-    bids_assigned: dictionary of drivers and route assignments
-    route_prefs: dictionary of (routes, capacity): seniority list
-    """
-    removed_bids = []
-    for key in list(new_routes.keys()):
-        if isinstance(new_routes[key], gsc.Route):
-            route = new_routes[key]
-            # Add the route to the driver, add the driver got the match, set the driver to not have that bid left
-            driver_matches[key].Routes.append(new_routes[key])
-            driver_matches[key].Hours+= new_routes[key].Hours
-            driver_matches[key].BidStatus[new_routes[key].ID] = f"Received Bid on iteration {iteration}"
-            driver_matches[key].ActiveBids.remove(new_routes[key])
-            # Handle assigned routes
-            if route.capacity == 1:
-                removed_bids.append(new_routes[key])
-                if route in bids_assigned.keys():
-                    bids_assigned[route].append(driver_matches[key])
-                else:
-                    bids_assigned[route] = [driver_matches[key]]
-                route_prefs.pop((route, route.capacity))
-                route.capacity = 0
-            else:
-                if route in bids_assigned.keys():
-                    bids_assigned[route].append(driver_matches[key])
-                else:
-                    bids_assigned[route] = [driver_matches[key]]
-                route_prefs[(route, route.capacity - 1)] = route_prefs.pop((route, route.capacity))
-                route.capacity -= 1
-    return bids_assigned, route_prefs, removed_bids
+    Input: Takes in the driver table (see read_seniority_data()), the form DataFrame and the charter table
+        (see read_charters_routes())
+    Output: Bid table with one row per bid: DriverID, RouteID, Rank (bid spot on the form, 1 is the first choice)
+    The bid spots are the columns numbered 1, 2, ... on the form, or the last FORM_BID_SLOTS columns if there are none
+    Only the last form submitted by each driver is used
+    """
+    form_data = form_data.drop_duplicates('Id', keep='last')
+    unknown = form_data['Id'][~form_data['Id'].isin(driver_table['DriverID'])]
+    if len(unknown):
+        raise KeyError(f"Bids from driver(s) not on the seniority list: {unknown.to_list()}")
+
+    # one reshape of the bid spots, row by row so each driver's bids stay in order, skipping empty spots
+    bids = form_data[bid_columns(form_data)].to_numpy()
+    rows, slots = np.nonzero(pd.notna(bids))
+    charter_ids = pd.Index(charter_table['RouteID'])
+    charters = charter_ids.get_indexer(bids[rows, slots])
+    if (charters < 0).any():
+        raise KeyError(f"Bids on charter(s) not in the charter list: {sorted(set(bids[rows, slots][charters < 0]))}")
+    return pd.DataFrame({
+        'DriverID': form_data['Id'].to_numpy()[rows],
+        'RouteID': charter_ids.to_numpy()[charters],
+        'Rank': slots + 1,
+    })
 
 
-def taken_bids(all_drivers, removed_bids, iteration, max_hours):
+def spreadsheet_rows(mask, limit=10):
     """
-    Remove bids that drivers can no longer take
-    all_drivers: list of all drivers
-    removed_bids: list of the bids fulfilled in the cycle
-    iteration: number in the iteration cycle"""
-    for driver in all_drivers:
-        revised_bids = []
-        for route in driver.ActiveBids:
-            if route in removed_bids:
-                driver.BidStatus[route.ID] = f'Route already assigned on iteration {iteration}'
-                #driver.ActiveBids.remove(route)
-            else:
-                revised_bids.append(route)
-        driver.ActiveBids = revised_bids
-        hour_limits(driver, max_hours)
-
-def remove_same_day(new_routes, driver_matches):
-    """
-    Remove bids that occur on the same day
-    new_routes: dictionary of routes that have been assigned in GS iteration
-    driver_matches: dictionary of driver id to driver objects"""
-    for key in list(new_routes.keys()):
-        if isinstance(new_routes[key], gsc.Route):
-            route = new_routes[key]
-            route_day = route.ActiveTimes.left.components[0]
-            revised_bids = []
-            for bid in driver_matches[key].ActiveBids:
-                if bid.ActiveTimes.left.components[0] == route_day:
-                    # Do not uncomment or delete it the next line. We don't why keeping this uncommented makes this run correctly.
-                    #if bid.ID not in driver_matches[key].BidStatus:
-                        driver_matches[key].BidStatus[bid.ID] = f"Already received bid on same day"
-                else:
-                    revised_bids.append(bid)
-            driver_matches[key].ActiveBids = revised_bids
-
-
-def post_processing(all_drivers, new_routes, driver_matches, iteration, bids_assigned, route_prefs, max_hours):
+    Helper for the validate functions below
+    Input: Boolean mask over the rows of an uploaded file
+    Output: The rows where mask is True as numbered in a spreadsheet (the header is row 1), at most limit of them listed
     """
-    Removes bids on days that a driver has a charter already assigned and removes already assigned routes
+    rows = (np.flatnonzero(np.asarray(mask, dtype=bool)) + 2).tolist()
+    text = ', '.join(map(str, rows[:limit]))
+    if len(rows) > limit:
+        text += f' and {len(rows) - limit} more'
+    return text
+
+
+def not_whole_number(values):
+    """
+    Helper for the validate functions below, True where a value is missing or not a whole number
     """
-    bids_assigned, route_prefs, removed_bids = assigned_bids(new_routes, driver_matches, iteration, bids_assigned,
-                                                             route_prefs)
-    taken_bids(all_drivers, removed_bids, iteration, max_hours)
-    remove_same_day(new_routes, driver_matches)
-    return bids_assigned, route_prefs
+    numbers = pd.to_numeric(values, errors='coerce')
+    return numbers.isna() | (numbers % 1 != 0)
 
 
-def diagnostics_sheet(drivers):
+def row_errors(checks):
     """
-    Returns diagnostic sheet (DataFrame of all Drivers, bids and the outcome of each bid)
+    Helper for the validate functions below
+    Input: List of (message, boolean mask over the rows) pairs
+    Output: One error message (with its rows) for every check that fails on any row
+    """
+    return [f"{message} on row(s) {spreadsheet_rows(mask)}" for message, mask in checks if np.any(mask)]
+
+
+def missing_columns(data, required):
     """
-    results = []
-    for driver in drivers:
-        # print(driver.BidStatus)
-        # print(driver.Hours)
-        for bid in driver.OriginalBids:
-            # try/except is critical
-            try:
-                z = driver.BidStatus[bid.ID]
-            except:
-                z = 5
-            arr = [driver.Name, driver.ID, bid.ID, bid.ActiveTimes.left, bid.ActiveTimes.right, z]
-            results.append(arr)
-
-    res_df = pd.DataFrame(results, columns=['DriverName','DriverID', 'RouteID', 'TimeStart', 'TimeEnd', 'Status'])
-    return res_df
+    Helper for the validate functions below, error message for the required columns that are not in data
+    """
+    missing = [col for col in required if col not in data.columns]
+    if missing:
+        return [f"missing columns: {', '.join(missing)}"]
+    return []
+
 
+def validate_standard_routes(data):
+    """
+    Input: Bytecurve standard routes export (see read_standard_routes())
+    Output: List of every problem found in the file, with the rows it is on (empty if the file can be read)
+    """
+    errors = missing_columns(data, ['Route identifier', 'Employee', 'Days of the week', 'Depot departure time',
+                                    'Depot return time'])
+    if errors:
+        return errors
+    dep = pd.to_datetime(data['Depot departure time'], format="%I:%M %p", errors='coerce')
+    ret = pd.to_datetime(data['Depot return time'], format="%I:%M %p", errors='coerce')
+    dow = data['Days of the week']
+    bad_dow = dow.isna() | ~dow.astype(str).str.fullmatch(f"[{''.join(dow_to_day)}]+")
+    return row_errors([
+        ("'Employee' is not a driver ID", not_whole_number(data['Employee'])),
+        (f"'Days of the week' has codes other than {''.join(dow_to_day)}", bad_dow),
+        ("'Depot departure time' is not a time like 6:00 AM", dep.isna()),
+        ("'Depot return time' is not a time like 9:29 AM", ret.isna()),
+        ("'Depot return time' is before 'Depot departure time'", ret < dep),
+    ])
+
+
+def validate_charters(data):
+    """
+    Input: Charter data (see read_charters_routes())
+    Output: List of every problem found in the file, with the rows it is on (empty if the file can be read)
+    """
+    errors = missing_columns(data, ['Buses', 'Trip Number', 'P/U Time', 'Return Time', 'Trip Date'])
+    if errors:
+        return errors
+    buses = pd.to_numeric(data['Buses'], errors='coerce')
+    return row_errors([
+        ("'Trip Number' is missing", data['Trip Number'].isna()),
+        ("'Trip Number' is repeated", data['Trip Number'].duplicated(keep=False) & data['Trip Number'].notna()),
+        ("'Buses' is not a whole number of buses", not_whole_number(data['Buses']) | (buses < 0)),
+        ("'P/U Time' is not a time like 18:30:00",
+         pd.to_datetime(data['P/U Time'], format='%H:%M:%S', errors='coerce').isna()),
+        ("'Return Time' is not a time like 23:30:00",
+         pd.to_datetime(data['Return Time'], format='%H:%M:%S', errors='coerce').isna()),
+        ("'Trip Date' is not a date", pd.to_datetime(data['Trip Date'], format='mixed', errors='coerce').isna()),
+    ])
+
+
+def validate_seniority(data):
+    """
+    Input: Seniority DataFrame (see read_seniority_data())
+    Output: List of every problem found in the file, with the rows it is on (empty if the file can be read)
+    """
+    errors = missing_columns(data, ['FullName', 'DriverID', 'SeniorityNumber'])
+    if errors:
+        return errors
+    return row_errors([
+        ("'DriverID' is not a driver ID", not_whole_number(data['DriverID'])),
+        ("'DriverID' is repeated", data['DriverID'].duplicated(keep=False) & data['DriverID'].notna()),
+        ("'SeniorityNumber' is not a number",
+         pd.to_numeric(data['SeniorityNumber'], errors='coerce').isna() & data['SeniorityNumber'].notna()),
+        ("'SeniorityNumber' is repeated",
+         data['SeniorityNumber'].duplicated(keep=False) & data['SeniorityNumber'].notna()),
+    ])
+
+
+def validate_bids(form_data):
+    """
+    Input: Form DataFrame of the driver bids (see read_charter_bids())
+    Output: List of every problem found in the file, with the rows it is on (empty if the file can be read)
+    """
+    errors = missing_columns(form_data, ['Id'])
+    if errors:
+        return errors
+    bids = form_data[bid_columns(form_data)]
+    return row_errors([
+        ("'Id' is not a driver ID", not_whole_number(form_data['Id'])),
+        ("a bid is not a trip number", (bids.notna() & bids.apply(not_whole_number)).any(axis=1)),
+    ])
+
+
+def validate_force_rejects(data):
+    """
+    Input: Force rejections DataFrame (columns DriverID, RouteID)
+    Output: List of every problem found in the file, with the rows it is on (empty if the file can be read)
+    """
+    errors = missing_columns(data, ['DriverID', 'RouteID'])
+    if errors:
+        return errors
+    return row_errors([
+        ("'DriverID' is not a driver ID", not_whole_number(data['DriverID'])),
+        ("'RouteID' is not a trip number", not_whole_number(data['RouteID'])),
+    ])
+
+
+def validate_bid_references(seniority_data, charter_data, form_data):
+    """
+    Input: Seniority, charter and bid DataFrames that passed their own validation
+    Output: List of the bids that name a driver not on the seniority list or a charter not on the charter list, with
+        the rows of the bid file they are on
+    """
+    bids = form_data[bid_columns(form_data)]
+    return row_errors([
+        ("'Id' is not on the seniority list", ~form_data['Id'].isin(seniority_data['DriverID'])),
+        ("a bid is on a trip not in the charter list",
+         (bids.notna() & ~bids.isin(charter_data['Trip Number'].to_list())).any(axis=1)),
+    ])
+
+
+def validate_route_references(seniority_data, route_data):
+    """
+    Input: Seniority and standard routes DataFrames that passed their own validation
+    Output: List of the standard routes of a driver not on the seniority list, with the rows of the routes file they
+        are on
+    """
+    return row_errors([
+        ("'Employee' is not on the seniority list", ~route_data['Employee'].isin(seniority_data['DriverID'])),
+    ])
+
+
+def validate_force_reject_references(seniority_data, charter_data, force_reject_data):
+    """
+    Input: Seniority, charter and force rejections DataFrames that passed their own validation
+    Output: List of the force rejections that name a driver not on the seniority list or a charter not on the charter
+        list, with the rows of the force rejections file they are on
+    """
+    return row_errors([
+        ("'DriverID' is not on the seniority list", ~force_reject_data['DriverID'].isin(seniority_data['DriverID'])),
+        ("'RouteID' is not a trip in the charter list", ~force_reject_data['RouteID'].isin(charter_data['Trip Number'])),
+    ])
+
+
+def build_allocation_model(driver_table, std_intervals, charter_table, bid_table, seniority_rank):
+    """
+    Input: Driver table (with standard route hours, see initialize()), interval table of standard routes,
+        charter table (see read_charters_routes()), bid table (see read_charter_bids()),
+        dictionary mapping driver IDs to seniority rank
+    Output: AllocationModel holding the drivers, charters and bids as arrays
+    A charter bid more than once by the same driver is only kept at its first position
+    """
+    n_drivers = len(driver_table)
+    driver_index = {driver_id: d for d, driver_id in enumerate(driver_table['DriverID'])}
+    std_driver = std_intervals['DriverID'].map(driver_index).to_numpy(np.int64)
+    std_order = np.argsort(std_driver, kind='stable')
+    std_ptr = np.concatenate([[0], np.cumsum(np.bincount(std_driver, minlength=n_drivers))])
+
+    bids = pd.DataFrame({
+        'Driver': bid_table['DriverID'].map(driver_index).to_numpy(np.int64),
+        'Charter': pd.Index(charter_table['RouteID']).get_indexer(bid_table['RouteID']),
+        'Rank': bid_table['Rank'].to_numpy(),
+    })
+    bids = bids.sort_values(['Driver', 'Rank'], kind='stable').drop_duplicates(['Driver', 'Charter'])
+    bid_ptr = np.concatenate([[0], np.cumsum(np.bincount(bids['Driver'], minlength=n_drivers))])
+    return gsc.AllocationModel(
+        driver_ids=driver_table['DriverID'].to_numpy(),
+        driver_names=driver_table['Name'].to_numpy(),
+        seniority_numbers=driver_table['SeniorityNumber'].to_numpy(),
+        driver_hours=driver_table['Hours'].to_numpy(),
+        driver_rank=driver_table['DriverID'].map(seniority_rank).to_numpy(),
+        std_ptr=std_ptr,
+        std_start=std_intervals['StartMin'].to_numpy(np.int64)[std_order],
+        std_end=std_intervals['EndMin'].to_numpy(np.int64)[std_order],
+        charter_ids=charter_table['RouteID'].to_numpy(),
+        charter_capacity=charter_table['Capacity'].to_numpy(),
+        charter_hours=charter_table['Hours'].to_numpy(),
+        charter_start=charter_table['StartMin'].to_numpy(),
+        charter_end=charter_table['EndMin'].to_numpy(),
+        charter_day=charter_table['Day'].to_numpy(),
+        bid_ptr=bid_ptr, bid_charter=bids['Charter'].to_numpy())
+
+
+def assigned_bids(model, awarded, bids, iteration):
+    """
+    Add routes to the driver's current routes
+    model: AllocationModel
+    awarded: drivers that received a route in GS iteration, in seniority order
+    bids: bid each of those drivers received
+    iteration: number of iterations
+    Returns the routes that are now full
+    """
+    charters = model.bid_charter[bids]
+    # Add the route hours to the driver, set the driver to not have that bid left
+    model.driver_hours[awarded] += model.charter_hours[charters]
+    model.bid_active[bids] = False
+    model.bid_status[bids] = gsc.RECEIVED
+    model.bid_iteration[bids] = iteration
+    # Handle assigned routes
+    np.subtract.at(model.charter_capacity, charters, 1)
+    model.assigned_driver.extend(awarded.tolist())
+    model.assigned_charter.extend(charters.tolist())
+    removed_bids = np.unique(charters[model.charter_capacity[charters] == 0])
+    return removed_bids
+
+
+def taken_bids(model, removed_bids, iteration, max_hours, awarded):
+    """
+    Remove bids that drivers can no longer take
+    model: AllocationModel
+    removed_bids: array of the routes fulfilled in the cycle
+    iteration: number in the iteration cycle
+    awarded: drivers that received a route in GS iteration, the only drivers whose hours changed"""
+    taken = csr_rows(model.charter_bid_ptr, removed_bids)
+    taken = model.charter_bids[taken]
+    taken = taken[model.bid_active[taken]]
+    model.bid_active[taken] = False
+    model.bid_status[taken] = gsc.ROUTE_TAKEN
+    model.bid_iteration[taken] = iteration
+    hour_limits(model, max_hours, awarded)
+
+
+def remove_same_day(model, awarded, bids):
+    """
+    Remove bids that occur on the same day, by dropping each awarded driver's bids on that day in one slice
+    model: AllocationModel
+    awarded: drivers that received a route in GS iteration
+    bids: bid each of those drivers received"""
+    awarded_day = model.charter_day[model.bid_charter[bids]]
+    same_day = model.day_bids[csr_rows(model.day_bid_ptr, 7 * np.asarray(awarded, dtype=np.int64) + awarded_day)]
+    same_day = same_day[model.bid_active[same_day]]
+    model.bid_active[same_day] = False
+    model.bid_status[same_day] = gsc.SAME_DAY
+
+
+def post_processing(model, awarded, bids, iteration, max_hours):
+    """
+    Removes bids on days that a driver has a charter already assigned and removes already assigned routes
+    awarded: drivers that received a route in GS iteration, in seniority order
+    bids: bid each of those drivers received
+    """
+    removed_bids = assigned_bids(model, awarded, bids, iteration)
+    taken_bids(model, removed_bids, iteration, max_hours, awarded)
+    remove_same_day(model, awarded, bids)
+
+
+def serial_dictatorship(model, max_hours, max_charters=7):
+    """
+    Allocation engine for when every charter ranks drivers by the same seniority list. Deferred acceptance then never
+    bumps anyone, so the allocation comes down to drivers choosing in seniority order. This makes one pass in seniority
+    order, letting each driver take their best remaining bids up to the limits the iterations enforce: one charter per
+    day, max_hours per week and max_charters charters. Unlike the iterations, a driver's later picks come before the
+    first pick of less senior drivers.
+    Bids are marked with the same statuses as post_processing(), where the iteration is the driver's pick number
+    (for bids on full routes, the pick number that filled the route), bids on charters with no buses stay undecided
+    Returns the last driver assigned a route (None if no routes were assigned)
+    """
+    bid_ptr = model.bid_ptr.tolist()
+    bid_charter = model.bid_charter.tolist()
+    bid_active = model.bid_active.tolist()
+    capacity = model.charter_capacity.tolist()
+    charter_hours = model.charter_hours.tolist()
+    charter_day = model.charter_day.tolist()
+    filled_on = [0] * model.n_charters  # pick number that filled each route
+    decided, statuses, iterations = [], [], []
+    last_empl = None
+    for d in np.argsort(model.driver_rank, kind='stable').tolist():
+        hours = float(model.driver_hours[d])
+        days = set()
+        for bid in range(bid_ptr[d], bid_ptr[d + 1]):
+            if len(days) == max_charters:
+                break
+            if not bid_active[bid]:
+                continue
+            c = bid_charter[bid]
+            iteration = 0
+            if capacity[c] == 0 and filled_on[c] == 0:
+                # charter with no buses to fill, its bids are left undecided as in the iterations
+                continue
+            if capacity[c] == 0:
+                status, iteration = gsc.ROUTE_TAKEN, filled_on[c]
+            elif not hours + charter_hours[c] <= max_hours:
+                status = gsc.HOUR_LIMIT
+            elif charter_day[c] in days:
+                status = gsc.SAME_DAY
+            else:
+                days.add(charter_day[c])
+                hours += charter_hours[c]
+                capacity[c] -= 1
+                if capacity[c] == 0:
+                    filled_on[c] = len(days)
+                status, iteration = gsc.RECEIVED, len(days)
+                model.assigned_driver.append(d)
+                model.assigned_charter.append(c)
+                last_empl = d
+            decided.append(bid)
+            statuses.append(status)
+            iterations.append(iteration)
+        model.driver_hours[d] = hours
+    model.charter_capacity[:] = capacity
+    model.bid_active[decided] = False
+    model.bid_status[decided] = statuses
+    model.bid_iteration[decided] = iterations
+    return last_empl
+
+
+def allocation_results(model):
+    """
+    Driver and Route views of the AllocationModel for diagnostics and display
+    Output: List of all drivers, dictionary mapping driver IDs to Drivers, list of all charter Routes,
+        dictionary mapping each assigned Route to the Drivers assigned to it
+    """
+    charter_routes = [gsc.Route(model, c) for c in range(model.n_charters)]
+    drivers = [gsc.Driver(model, d) for d in range(model.n_drivers)]
+    id_to_drivers = {driver.ID: driver for driver in drivers}
+    bids_assigned = {}
+    for d, c in zip(model.assigned_driver, model.assigned_charter):
+        bids_assigned.setdefault(charter_routes[c], []).append(drivers[d])
+    return drivers, id_to_drivers, charter_routes, bids_assigned
+
+
+def allocation_summary(model, last_empl):
+    """
+    Input: AllocationModel after the allocation, ID of the last employee assigned a route (see outline.allocate_routes())
+    Output: Dictionary of the headline numbers of the allocation, used to compare runs with different parameters:
+        charters left with open seats, seats left open, routes assigned, total hours of the routes assigned and
+        seniority number of the last employee assigned
+    """
+    last_seniority = None
+    if last_empl is not None:
+        last_seniority = model.seniority_numbers[model.driver_index[last_empl]]
+    return {
+        'Unassigned Charters': int(np.count_nonzero(model.charter_capacity > 0)),
+        'Open Seats': int(model.charter_capacity.sum()),
+        'Assigned Routes': len(model.assigned_charter),
+        'Total Assigned Hours': float(model.charter_hours[model.assigned_charter].sum()),
+        'Last Seniority Number': last_seniority,
+    }
+
+
+def assignments_table(bids_assigned, seniority_data, charter_data):
+    """
+    Input: Dictionary mapping each assigned Route to its Drivers (see allocation_results()), seniority DataFrame and
+        charter DataFrame (see templates)
+    Output: Assignment table with one row per assigned (driver, charter), sorted by seniority number
+    Routes with more than one driver get a letter per driver in the order they were assigned (471936A, 471936B, ...)
+    """
+    routes = [route for route, drivers in bids_assigned.items() for _ in drivers]
+    drivers = [driver for drivers in bids_assigned.values() for driver in drivers]
+    assigned = pd.DataFrame({
+        'RouteID': [route.ID for route in routes],
+        'DriverID': [driver.ID for driver in drivers],
+        'SeniorityNumber': [driver.SeniorityNumber for driver in drivers],
+    })
+    columns = ['Driver Name', 'Seniority Number', 'Driver ID', 'Route ID', 'Route Pickup Location',
+               'Route Destination', 'Charter Date', 'Pick Up Time', 'Return Time']
+    if assigned.empty:
+        return pd.DataFrame(columns=columns)
+
+    # one indexed lookup per assignment instead of a scan of the seniority and charter lists, by driver ID which is
+    # unique on the seniority list (see validate_seniority())
+    assigned = assigned.join(seniority_data.set_index('DriverID')['FullName'], on='DriverID')
+    charter_columns = ['P/U Time', 'Return Time', 'Trip Date', 'Pick Up Location', 'Destination']
+    assigned = assigned.join(charter_data.set_index('Trip Number')[charter_columns], on='RouteID')
+
+    # drivers of a route are listed together in the order they were assigned
+    by_route = assigned.groupby('RouteID', sort=False)['RouteID']
+    slot = by_route.cumcount().to_numpy()
+    shared = by_route.transform('size').to_numpy() >= 2
+    suffix = np.array([chr(ord('a') + k).upper() for k in range(slot.max() + 1)], dtype=object)[slot]
+    route_id = assigned['RouteID'].to_numpy(dtype=object).copy()
+    route_id[shared] = assigned['RouteID'][shared].astype(str) + suffix[shared]
+
+    output_df = pd.DataFrame({
+        'Driver Name': assigned['FullName'],
+        'Seniority Number': assigned['SeniorityNumber'],
+        'Driver ID': assigned['DriverID'],
+        'Route ID': route_id,
+        'Route Pickup Location': assigned['Pick Up Location'],
+        'Route Destination': assigned['Destination'],
+        'Charter Date': assigned['Trip Date'],
+        'Pick Up Time': pd.to_datetime(assigned['P/U Time'], format='%H:%M:%S').dt.time,
+        'Return Time': pd.to_datetime(assigned['Return Time'], format='%H:%M:%S').dt.time,
+    }, columns=columns)
+    return output_df.sort_values(by='Seniority Number')
+
+
+def unassigned_table(unassigned_charters, id_to_drivers):
+    """
+    Input: Charter Routes left with open seats, dictionary mapping driver IDs to Drivers (see allocation_results())
+    Output: Table of the unassigned charters: Charter ID, seats left unassigned and names of the drivers assigned
+    """
+    charter_rows = []
+    for charter in unassigned_charters:
+        drivers = [id_to_drivers[driver].Name for driver in charter.AssignedDrivers]
+        charter_rows.append({
+            "Charter ID": charter.ID,
+            "Charter Left Unassigned": charter.capacity,
+            "Charter Drivers Assigned": ", ".join(drivers)
+        })
+    return pd.DataFrame(charter_rows)
+
+
+def diagnostics_sheet(drivers, bids=None):
+    """
+    Returns diagnostic sheet (DataFrame of all Drivers, bids and the outcome of each bid)
+    Built column-wise from the AllocationModel behind the Drivers, for bids (positions in the bid arrays) if given
+    """
+    columns = ['DriverName', 'DriverID', 'RouteID', 'TimeStart', 'TimeEnd', 'Status']
+    if not drivers:
+        return pd.DataFrame(columns=columns)
+    model = drivers[0].model
+    if bids is None:
+        bids = csr_rows(model.bid_ptr, [driver.index for driver in drivers])
+    d, c = model.bid_driver[bids], model.bid_charter[bids]
+    return pd.DataFrame({
+        'DriverName': model.driver_names[d],
+        'DriverID': model.driver_ids[d],
+        'RouteID': model.charter_ids[c],
+        # times relative to the start of the week
+        'TimeStart': pd.to_timedelta(model.charter_start[c], unit='m'),
+        'TimeEnd': pd.to_timedelta(model.charter_end[c], unit='m'),
+        'Status': model.status_text(bids),
+    }, columns=columns)
+
+
+def diagnostics_chunks(drivers, chunk_size=100000):
+    """
+    Yields the diagnostic sheet (see diagnostics_sheet()) in DataFrames of at most chunk_size bids, so only one
+    chunk is held in memory at a time
+    """
+    if not drivers:
+        yield diagnostics_sheet(drivers)
+        return
+    bids = csr_rows(drivers[0].model.bid_ptr, [driver.index for driver in drivers])
+    for start in range(0, max(len(bids), 1), chunk_size):
+        yield diagnostics_sheet(drivers, bids[start:start + chunk_size])
+
+
+def parquet_available():
+    """True if pyarrow, which the Parquet export needs, can be imported"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_diagnostics(drivers, file_format='csv', chunk_size=100000):
+    """
+    Yields the diagnostic sheet file one chunk at a time (see diagnostics_chunks()), for streaming downloads
+    file_format: 'csv' (yields text), 'csv.gz' (gzip-compressed CSV) or 'parquet' (yields bytes, needs pyarrow)
+    """
+    if file_format == 'parquet' and not parquet_available():
+        raise ImportError("Parquet export needs the pyarrow package (pip install pyarrow)")
+    chunks = diagnostics_chunks(drivers, chunk_size)
+    if file_format == 'csv':
+        for i, chunk in enumerate(chunks):
+            yield chunk.to_csv(index=False, header=(i == 0))
+    elif file_format == 'csv.gz':
+        gzip_stream = zlib.compressobj(wbits=31)  # wbits=31 writes the gzip header and trailer
+        for i, chunk in enumerate(chunks):
+            yield gzip_stream.compress(chunk.to_csv(index=False, header=(i == 0)).encode('utf-8'))
+        yield gzip_stream.flush()
+    elif file_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        sink = io.BytesIO()
+        writer = None
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk.astype({'Status': str}), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema)
+            writer.write_table(table)
+            # hand over what has been written so far and start the buffer again
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+        writer.close()
+        yield sink.getvalue()
+    else:
+        raise ValueError(f"Unknown diagnostics file format: {file_format}")
@@ -1,26 +1,120 @@
-from collections import defaultdict
-from typing import Dict, Set, Tuple, List
-import GS_Classes as gsc
+from collections import defaultdict, deque
+from typing import Dict, Tuple, List, Optional
+import numpy as np
 
 
-def employee_without_match(matches: Dict[str, str], employees: Set[str]) -> str:
+def propose(
+    proposers: List[int], next_bid: List[int], bid_end: List[int], bid_charter: List[int], bid_active: np.ndarray,
+    capacity: np.ndarray, rank: List[int]
+) -> Tuple[Dict[int, int], Optional[int]]:
     """
-    Helper function to determine if employee is unmatched.
-    Returns the first employee encountered that is not
-    yet matched. employees can be matched with a job, or
-    themselves. If matched to themselves, this means that the
-    matching algorithm has exhausted their entire preference
-    list. If all employees are matched, this function will
-    return None, and we will break from deferred acceptance algorithm.
+    Proposal loop of the deferred acceptance algorithm, see da().
+    proposers are the employees that take part, in the order they
+    propose. Employee e proposes to the active bids from position
+    next_bid[e] up to bid_end[e] of the flat bid arrays, and next_bid
+    is moved forward in place so a later call can carry on from
+    where this one stopped.
+    Returns the bid each matched employee is matched to and the last
+    employee to be assigned a job.
     """
-    for employee in employees:
-        if employee not in matches:
-            return employee
+    matches: Dict[int, int] = {}
+    job_assignments: Dict[int, List[int]] = defaultdict(list)
+    current_empl = None
+    # worklist of employees that are still unmatched. An employee stays at the front until they are matched (to a
+    # job or themselves); a bumped employee goes back on the front.
+    free_employees = deque(proposers)
+    while free_employees:
+        # get the next available employee that is still unmatched to a job. Once all employees have been matched
+        # (to a job or themselves) the worklist is empty and we leave the while loop. If an employee is matched to
+        # themself it means the algorithm exhausted their preference list (e-Resume), and was not able to match them
+        employee = free_employees[0]
+        bid = next_bid[employee]
+
+        # if we've gone through the employee's entire list, the employee stays unmatched
+        if bid >= bid_end[employee]:
+            free_employees.popleft()
+            continue
+        # increment counter so that next time through loop, we consider the next job on the preference list
+        next_bid[employee] = bid + 1
+        if not bid_active[bid]:
+            continue
+
+        # Try to match the current employee with the next available job on their rank ordered list
+        job = bid_charter[bid]
+        assigned = job_assignments[job]
+
+        # If job has available capacity, assign directly
+        if len(assigned) < capacity[job]:
+            assigned.append(employee)
+            matches[employee] = bid
+            current_empl = employee
+            free_employees.popleft()
+        else:
+            # Check if this employee is preferred over the least preferred current match,
+            # should never be true, see NU midterm or final report
+            worse_candidate = max(assigned, key=rank.__getitem__, default=None)
+            if worse_candidate is not None and rank[employee] < rank[worse_candidate]:
+                assigned.remove(worse_candidate)
+                assigned.append(employee)
+                current_empl = employee
+                matches[employee] = bid
+                del matches[worse_candidate]
+                free_employees.popleft()
+                free_employees.appendleft(worse_candidate)
+    return matches, current_empl
+
+
+def propose_batched(
+    proposers: np.ndarray, next_bid: np.ndarray, bid_end: np.ndarray, bid_charter: np.ndarray, bid_active: np.ndarray,
+    capacity: np.ndarray, rank: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, Optional[int]]:
+    """
+    Round-synchronous version of propose(), with the same arguments as
+    NumPy arrays. In each round every free employee proposes to their
+    next bid at once, and every job keeps its best ranked candidates
+    (the employees it holds plus the new proposals) up to its capacity
+    in one grouped sort, rejecting the rest. Employee-proposing deferred
+    acceptance ends at the same stable matching whatever order the
+    proposals are made in, so this gives the same matches as propose().
+    Returns the matched employees (in order of rank), the bid each of
+    them is matched to and the last ranked employee matched.
+    """
+    held_emp = np.empty(0, dtype=np.int64)
+    held_bid = np.empty(0, dtype=np.int64)
+    free = proposers[next_bid[proposers] < bid_end[proposers]]
+    while free.size:
+        bids = next_bid[free]
+        next_bid[free] += 1
+        # proposals to bids that are no longer active are skipped, those employees move on to their next bid
+        active = bid_active[bids]
+        skipped = free[~active]
+        free, bids = free[active], bids[active]
+
+        # jobs compare the new proposals with the employees they currently hold
+        contested = np.isin(bid_charter[held_bid], bid_charter[bids])
+        cand_emp = np.concatenate([held_emp[contested], free])
+        cand_bid = np.concatenate([held_bid[contested], bids])
+        cand_job = bid_charter[cand_bid]
+        order = np.lexsort((rank[cand_emp], cand_job))
+        cand_emp, cand_bid, cand_job = cand_emp[order], cand_bid[order], cand_job[order]
+        # position of each candidate in their job's ranking, the first capacity[job] of them are kept
+        group_start = np.flatnonzero(np.r_[True, cand_job[1:] != cand_job[:-1]])
+        seat = np.arange(len(cand_job)) - np.repeat(group_start, np.diff(np.r_[group_start, len(cand_job)]))
+        keep = seat < capacity[cand_job]
+
+        held_emp = np.concatenate([held_emp[~contested], cand_emp[keep]])
+        held_bid = np.concatenate([held_bid[~contested], cand_bid[keep]])
+        rejected = np.concatenate([cand_emp[~keep], skipped])
+        free = rejected[next_bid[rejected] < bid_end[rejected]]
+    order = np.argsort(rank[held_emp], kind='stable')
+    held_emp, held_bid = held_emp[order], held_bid[order]
+    current_empl = int(held_emp[-1]) if len(held_emp) else None
+    return held_emp, held_bid, current_empl
 
 
 def da(
-    employee_preferences: Dict[str, List[gsc.Route]], job_preferences: Dict[Tuple[gsc.Route, int], List[str]]
-) -> Tuple[Dict[str, gsc.Route], Dict[str, gsc.Route]]:
+    bid_ptr: np.ndarray, bid_charter: np.ndarray, bid_active: np.ndarray, capacity: np.ndarray, rank: np.ndarray
+) -> Tuple[np.ndarray, Optional[int]]:
     """
     Implementation of the deferred acceptance (DA) algorithm (also
     (also as Gale-Shapley algorithm), first published in 1962.
@@ -35,73 +129,94 @@ def da(
     list as possible. Algorithm terminates when either (1) all
     employees have been assigned, or (2) all employees have
     exhausted their preference lists (no more jobs available).
+    Employees and jobs are integers: the preference list of
+    employee e is the active bids among bid_charter[bid_ptr[e]:bid_ptr[e + 1]],
+    capacity[j] is the number of open spots on job j and every
+    job ranks employees by rank (lower is preferred).
+    Employees propose in order of the job ranking, so with one
+    ranking shared by every job nobody is ever bumped.
+    Returns the bid each employee is matched to (-1 if matched to
+    themself) and the last employee to be assigned a job.
     """
-    job_queue: Dict = defaultdict(int)
-    employees: List[str] = list(employee_preferences.keys())
-    matches: Dict[str, gsc.Route] = {}
+    n_employees = len(bid_ptr) - 1
+    bid_starts = bid_ptr.tolist()
+    matches, current_empl = propose(np.argsort(rank, kind='stable').tolist(), bid_starts[:-1], bid_starts[1:],
+                                    bid_charter.tolist(), bid_active, capacity, rank.tolist())
+    # return the matched bid of every employee (position in the flat bid arrays) and the last employee assigned
+    matched_bids = np.full(n_employees, -1, dtype=np.int64)
+    matched_bids[list(matches.keys())] = list(matches.values())
+    return matched_bids, current_empl
 
-    job_info: Dict[str, Tuple[gsc.Route, int, List[str]]] = {
-    route_obj.ID: (route_obj, capacity, prefs)
-    for (route_obj, capacity), prefs in job_preferences.items()
-    }
 
-    job_assignments: Dict[gsc.Route, List[str]] = defaultdict(list)
-    current_empl = None
-    while True:
-        # get the next available employee that is still unmatched to a job
-        employee = employee_without_match(matches, employees)
-        # once all employees have been matched (to a job or themselves), employee_without_match function will return
-        # a None type object, and we will break from while loop. If an employee is matched to themself it means the
-        # algorithm exhausted their preference list (e-Resume), and was not able to match them with any job
-        if not employee:
-            break
-
-        # queue (counter) to track which job we are currently considering for the current employee
-        # i.e., if job_index is 2, then we are considering the 3rd job on the given
-        # employee's preference list (0-indexing)
-        job_index = job_queue[employee]
-        # increment counter so that next time through loop, we consider the next job on the preference list
-        # since this is a defaultdict, new entries automatically start at 0
-        job_queue[employee] += 1
-
-        # Try to match the current employee with the next available job on their rank ordered list, if available
-        if job_index < len(employee_preferences[employee]):
-            job = employee_preferences[employee][job_index]
-            # print(employee, job.ID)
-        # if we've gone through the employee's entire list, assign employee to themself to indicate unmatched
-        else:
-            matches[employee] = employee
-            continue
-        
-        route_id = job.ID
-        if route_id not in job_info:
-            continue
+def da_batched(
+    bid_ptr: np.ndarray, bid_charter: np.ndarray, bid_active: np.ndarray, capacity: np.ndarray, rank: np.ndarray
+) -> Tuple[np.ndarray, Optional[int]]:
+    """
+    Deferred acceptance with round-synchronous proposals (see
+    propose_batched()), same inputs and outputs as da().
+    """
+    n_employees = len(bid_ptr) - 1
+    held_emp, held_bid, current_empl = propose_batched(np.argsort(rank, kind='stable'), bid_ptr[:-1].copy(),
+                                                       bid_ptr[1:], bid_charter, bid_active, capacity, rank)
+    matched_bids = np.full(n_employees, -1, dtype=np.int64)
+    matched_bids[held_emp] = held_bid
+    return matched_bids, current_empl
 
-        route_obj, capacity, prefs = job_info[route_id]
-        assigned = job_assignments[route_obj]
 
-        # If job has available capacity, assign directly
-        if len(assigned) < capacity:
-            assigned.append(employee)
-            matches[employee] = route_obj
-            current_empl = employee
+class DeferredAcceptanceRounds:
+    """
+    Runs deferred acceptance over repeated rounds, keeping its state
+    between rounds instead of starting each round from scratch.
+    Between rounds the caller removes assigned routes and rejected bids
+    by updating bid_active and capacity in place (they are shared, not
+    copied). A proposal is only rejected when its job is full, and a
+    full job stays full, so an employee who is unmatched after a round
+    can never be matched in a later one, and the bids an employee
+    already went past stay out of reach. Each round therefore only
+    lets the employees matched in the previous round propose again,
+    starting right after the bid they were matched to, and gives the
+    same matches as running da() again on the updated arrays.
+    With batched=True each round uses the round-synchronous
+    propose_batched() instead of the one-at-a-time propose().
+    """
+    def __init__(self, bid_ptr: np.ndarray, bid_charter: np.ndarray, bid_active: np.ndarray, capacity: np.ndarray,
+                 rank: np.ndarray, batched: bool = False):
+        self.batched = batched
+        self.bid_active = bid_active
+        self.capacity = capacity
+        # employees that propose in the next round, in order of the job ranking
+        proposers = np.argsort(rank, kind='stable')
+        if batched:
+            self.next_bid = bid_ptr[:-1].copy()
+            self.bid_end = bid_ptr[1:]
+            self.bid_charter = bid_charter
+            self.rank = rank
+            self.proposers = proposers
         else:
-            # Check if this employee is preferred over any current match, 
-            # should never be true, see NU midterm or final report
-            worse_candidate = None
-            for assigned_emp in assigned:
-                if (
-                    employee in prefs and assigned_emp in prefs
-                    and prefs.index(employee) < prefs.index(assigned_emp)
-                ):
-                    worse_candidate = assigned_emp
-                    break
-
-            if worse_candidate:
-                assigned.remove(worse_candidate)
-                assigned.append(employee)
-                current_empl = employee
-                matches[employee] = route_obj
-                del matches[worse_candidate]
-    # return two-sided match (employee to job and job to employee), and one-sided match (employee to job)
-    return matches, {employee: matches[employee] for employee in employees}, current_empl
+            # the one-at-a-time loop is faster on plain lists
+            bid_starts = bid_ptr.tolist()
+            self.next_bid = bid_starts[:-1]
+            self.bid_end = bid_starts[1:]
+            self.bid_charter = bid_charter.tolist()
+            self.rank = rank.tolist()
+            self.proposers = proposers.tolist()
+
+    def run_round(self) -> Tuple[np.ndarray, np.ndarray, Optional[int]]:
+        """
+        Runs one round of deferred acceptance.
+        Returns the employees matched in the round (in proposal order),
+        the bid each of them is matched to and the last employee to be
+        assigned a job.
+        """
+        if self.batched:
+            matched_employees, matched_bids, current_empl = propose_batched(
+                self.proposers, self.next_bid, self.bid_end, self.bid_charter, self.bid_active, self.capacity, self.rank)
+            self.proposers = matched_employees
+            return matched_employees, matched_bids, current_empl
+        matches, current_empl = propose(self.proposers, self.next_bid, self.bid_end, self.bid_charter,
+                                        self.bid_active, self.capacity, self.rank)
+        # only the employees that were just matched can be matched again next round
+        self.proposers = [employee for employee in self.proposers if employee in matches]
+        matched_employees = np.asarray(self.proposers, dtype=np.int64)
+        matched_bids = np.asarray([matches[employee] for employee in self.proposers], dtype=np.int64)
+        return matched_employees, matched_bids, current_empl
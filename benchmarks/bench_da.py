@@ -0,0 +1,61 @@
+### Benchmark for the deferred acceptance matching, run from the repository root with: python benchmarks/bench_da.py
+## Times a single da() call on synthetic bids at growing sizes and reports the time per proposal, which should stay
+## roughly flat as the number of drivers grows (linear scaling in the total number of proposals), next to the
+## round-synchronous da_batched() on the same inputs
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import algos.deferred_acceptance as def_ac
+
+
+def make_instance(n_drivers, bids_per_driver, seed=0):
+    """
+    Builds da() inputs with n_drivers drivers bidding on a shared pool of charters,
+    so that most bids are contested and most drivers propose down a long part of their list
+    """
+    rng = np.random.default_rng(seed)
+    n_charters = max(n_drivers // 2, bids_per_driver)
+    capacity = rng.integers(1, 4, n_charters).astype(np.int32)
+    bid_ptr = np.arange(n_drivers + 1, dtype=np.int64) * bids_per_driver
+    bid_charter = np.concatenate([rng.choice(n_charters, bids_per_driver, replace=False)
+                                  for _ in range(n_drivers)]).astype(np.int32)
+    bid_active = np.ones(len(bid_charter), dtype=bool)
+    rank = np.arange(n_drivers, dtype=np.int32)
+    return bid_ptr, bid_charter, bid_active, capacity, rank
+
+
+def count_proposals(bid_ptr, matched_bids):
+    """
+    Number of proposals made by da() when every bid is active: every bid up to and including the matched one,
+    or the whole list for drivers matched to themselves
+    """
+    lengths = np.diff(bid_ptr)
+    matched = matched_bids >= 0
+    return int(np.where(matched, matched_bids - bid_ptr[:-1] + 1, lengths).sum())
+
+
+def main():
+    bids_per_driver = 50
+    print(f"{'drivers':>8} {'proposals':>10} {'da s':>8} {'us/proposal':>12} {'batched s':>10}")
+    for n_drivers in [500, 1000, 2000, 4000, 8000, 16000]:
+        bid_ptr, bid_charter, bid_active, capacity, rank = make_instance(n_drivers, bids_per_driver)
+        start = time.perf_counter()
+        matched_bids, _ = def_ac.da(bid_ptr, bid_charter, bid_active, capacity, rank)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        batched_bids, _ = def_ac.da_batched(bid_ptr, bid_charter, bid_active, capacity, rank)
+        elapsed_batched = time.perf_counter() - start
+        assert (matched_bids == batched_bids).all(), "da and da_batched disagree"
+        proposals = count_proposals(bid_ptr, matched_bids)
+        print(f"{n_drivers:>8} {proposals:>10} {elapsed:>8.3f} {1e6 * elapsed / proposals:>12.2f} "
+              f"{elapsed_batched:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
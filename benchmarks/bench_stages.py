@@ -0,0 +1,161 @@
+### Benchmark of every stage of the allocation, run from the repository root with: python benchmarks/bench_stages.py
+## Generates synthetic inputs at growing scales (see generate_data.py) and reports the wall time and the peak memory
+## allocated by each stage, one column per scale, so a stage that stops scaling with the input size stands out
+## --csv saves the results, and --baseline compares a run with saved results, flagging the stages that got slower
+
+import argparse
+from contextlib import contextmanager
+import os
+import sys
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import GS_Functions as gsf
+from generate_data import generate_inputs
+from outline import ENGINES, allocate_routes, prepare_model
+from run_metrics import RunMetrics, measure
+
+# (drivers, charters) of each scale
+SCALES = [(500, 400), (1000, 800), (2000, 1600), (4000, 3200), (8000, 6400)]
+
+
+class TracedMetrics(RunMetrics):
+    """
+    RunMetrics recording the peak memory allocated by every stage and iteration in peaks (stage name: MB) instead of
+    their times, for a run under tracemalloc
+    """
+    def __init__(self):
+        super().__init__()
+        self.peaks = {}
+
+    @contextmanager
+    def stage(self, name):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peaks[name] = (peak - start) / 2 ** 20
+
+    def run_round(self, rounds, iteration):
+        with self.stage(f'da round {iteration}'):
+            return super().run_round(rounds, iteration)
+
+    def post_processing(self, model, awarded, bids, iteration, max_hours):
+        with self.stage(f'post_processing {iteration}'):
+            super().post_processing(model, awarded, bids, iteration, max_hours)
+
+
+def run_stages(inputs, metrics, max_hours=40, padding=30, sen_num=0, engine='rounds'):
+    """
+    Runs the allocation of outline.gale_shapley_main() through prepare_model() and allocate_routes(), recording every
+    stage into metrics (a run_metrics.RunMetrics), followed by the tables the Shiny app builds from it
+    """
+    model = prepare_model(inputs['routes'], inputs['seniority'], inputs['charters'], inputs['bids'], padding, sen_num,
+                          metrics=metrics)
+    allocate_routes(model, gsf.force_reject_list(inputs['force_rejections']), max_hours, engine, metrics=metrics)
+    with measure(metrics, 'allocation_results'):
+        all_drivers, driver_matches, charter_routes, bids_assigned = gsf.allocation_results(model)
+    with measure(metrics, 'diagnostics_sheet'):
+        gsf.diagnostics_sheet(all_drivers)
+    with measure(metrics, 'assignments_table (app)'):
+        gsf.assignments_table(bids_assigned, inputs['seniority'], inputs['charters'])
+    with measure(metrics, 'unassigned_table (app)'):
+        unassigned = [charter for charter in charter_routes if charter.capacity > 0]
+        gsf.unassigned_table(unassigned, driver_matches)
+
+
+def stage_seconds(metrics):
+    """Seconds of every stage of a run in the order they ran, with one row per round and post-processing"""
+    seconds = {}
+    for name, total in metrics.stages.items():
+        if name == 'deferred_acceptance':
+            for record in metrics.iterations:
+                seconds[f"da round {record['iteration']}"] = record['da_seconds']
+                if 'post_processing_seconds' in record:
+                    seconds[f"post_processing {record['iteration']}"] = record['post_processing_seconds']
+        elif name != 'post_processing':
+            seconds[name] = total
+    return seconds
+
+
+def measure_stages(inputs, repeat=3, engine='rounds'):
+    """
+    Runs the stages repeat times for the wall times (the fastest run of each stage is kept) and once more under
+    tracemalloc for the peak memory of each stage (tracemalloc slows the stages down, so it is kept out of the timed runs)
+    Returns a DataFrame with one row per stage: stage, seconds, peak_mb
+    """
+    seconds = {}
+    for _ in range(repeat):
+        metrics = RunMetrics()
+        run_stages(inputs, metrics, engine=engine)
+        for name, value in stage_seconds(metrics).items():
+            seconds[name] = min(seconds.get(name, float('inf')), value)
+    traced = TracedMetrics()
+    tracemalloc.start()
+    try:
+        run_stages(inputs, traced, engine=engine)
+    finally:
+        tracemalloc.stop()
+    return pd.DataFrame({'stage': list(seconds), 'seconds': list(seconds.values()),
+                         'peak_mb': [traced.peaks.get(stage) for stage in seconds]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every stage of the allocation at growing scales')
+    parser.add_argument('--scales', nargs='+', default=[f'{d}x{c}' for d, c in SCALES],
+                        help='scales as DRIVERSxCHARTERS, e.g. 1000x800 4000x3200')
+    parser.add_argument('--bids-per-driver', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each scale, the fastest is reported')
+    parser.add_argument('--engine', choices=ENGINES, default='rounds', help='allocation engine, see gale_shapley_main()')
+    parser.add_argument('--csv', help='save the results to this csv')
+    parser.add_argument('--baseline', help='csv saved by an earlier run (--csv) to compare the times with')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='flag stages slower than the baseline by more than this factor')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='stages faster than this in the baseline are too noisy to compare')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        n_drivers, n_charters = (int(n) for n in scale.lower().split('x'))
+        inputs = generate_inputs(n_drivers, n_charters, args.bids_per_driver, seed=args.seed)
+        stages = measure_stages(inputs, args.repeat, args.engine)
+        stages.insert(0, 'scale', scale)
+        stages.insert(1, 'bids', int(inputs['bids'].iloc[:, 4:].notna().to_numpy().sum()))
+        results.append(stages)
+        print(f"{scale}: {stages['seconds'].sum():.3f}s in total", flush=True)
+
+    # one column per scale, stages in the order they run (scales can take a different number of rounds)
+    runs = [list(stages['stage']) for stages in results]
+    order = max(runs, key=len)
+    order += [stage for run in runs for stage in run if stage not in order]
+    results = pd.concat(results, ignore_index=True)
+    for value, title, digits in [('seconds', 'Wall time (s)', 4), ('peak_mb', 'Peak memory allocated (MB)', 2)]:
+        table = results.pivot(index='stage', columns='scale', values=value).reindex(index=order, columns=args.scales)
+        print(f"\n{title}")
+        print(table.round(digits).to_string())
+
+    if args.csv:
+        results.to_csv(args.csv, index=False)
+    if args.baseline:
+        baseline = pd.read_csv(args.baseline)
+        compared = results.merge(baseline, on=['scale', 'stage'], suffixes=('', '_baseline'))
+        compared['ratio'] = compared['seconds'] / compared['seconds_baseline']
+        compared = compared[compared['seconds_baseline'] >= args.min_seconds]
+        slower = compared[compared['ratio'] > args.tolerance]
+        print(f"\n{len(slower)} of {len(compared)} stages slower than the baseline by more than {args.tolerance}x")
+        if len(slower):
+            print(slower[['scale', 'stage', 'seconds_baseline', 'seconds', 'ratio']].round(4).to_string(index=False))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+### Startup benchmark of the app, run from the repository root with: python benchmarks/bench_startup.py
+## Starts the app repeatedly and reports the time from starting the process to the first page served (HTTP 200)
+## By default the app is started from source (python run_shiny.py), --command times another launcher, e.g. the
+## packaged app: python benchmarks/bench_startup.py --command dist/run_shiny/run_shiny.exe
+## The launcher is given --port and --no-browser (see run_shiny.py)
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def free_port():
+    """A port nothing is listening on"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_page(command, timeout=120.0):
+    """
+    Starts command with a free port and polls the app until its page is served
+    Returns the seconds from starting the process to the first HTTP 200, the process is stopped afterwards
+    """
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/'
+    start = time.perf_counter()
+    process = subprocess.Popen(command + ['--port', str(port), '--no-browser'], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"{' '.join(command)} exited with code {process.returncode} before serving the page")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(0.02)
+        raise RuntimeError(f"{' '.join(command)} did not serve {url} within {timeout}s")
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time from starting the app to its first page served')
+    parser.add_argument('--command', nargs='+', default=[sys.executable, 'run_shiny.py'],
+                        help='launcher of the app (default: python run_shiny.py)')
+    parser.add_argument('--repeat', type=int, default=5, help='number of starts timed')
+    parser.add_argument('--timeout', type=float, default=120.0, help='seconds to wait for the first page of a start')
+    args = parser.parse_args()
+
+    times = []
+    for i in range(args.repeat):
+        times.append(time_to_first_page(args.command, args.timeout))
+        print(f'start {i + 1}: {times[-1]:.2f}s', flush=True)
+    # the first start is often slower (cold disk cache, first extraction of a packaged app), so both are reported
+    print(f'first {times[0]:.2f}s, min {min(times):.2f}s, median {statistics.median(times):.2f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+### Synthetic input files for the benchmarks, run from the repository root with e.g.:
+##     python benchmarks/generate_data.py --drivers 2000 --charters 1500 --out synthetic_data
+## Writes routes.csv (Bytecurve standard routes export), seniority.csv, charters.csv, bids.csv (Microsoft Forms export)
+## and force.csv in the formats of the templates, so they can be uploaded to the app or listed in a run_batch.py manifest
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from GS_Functions import FORM_BID_SLOTS, MINUTES_PER_DAY, dow_to_day
+
+
+def clock_times(minutes):
+    """Minutes after midnight as Bytecurve times, like 6:05 AM"""
+    hours, mins = np.divmod(minutes, 60)
+    hour12 = pd.Series((hours + 11) % 12 + 1).astype(str)
+    return (hour12 + ':' + pd.Series(mins).astype(str).str.zfill(2) + np.where(hours < 12, ' AM', ' PM')).to_numpy()
+
+
+def form_times(minutes):
+    """Minutes after midnight as charter list times, like 18:30:00"""
+    hours, mins = np.divmod(minutes, 60)
+    return (pd.Series(hours).astype(str).str.zfill(2) + ':' + pd.Series(mins).astype(str).str.zfill(2) + ':00').to_numpy()
+
+
+def generate_inputs(n_drivers, n_charters, bids_per_driver=20, max_buses=3, overnight_share=0.15, seed=0):
+    """
+    Builds a synthetic season week:
+    drivers: n_drivers on the seniority list, about 70% of them with 1 or 2 standard routes on random days
+    charters: n_charters trips over one week with 1 to max_buses buses (5% need none), overnight_share of them return
+        the next day and 3% return at the pick-up time (24 hour trips)
+    bids: 85% of the drivers fill in the form with 1 to bids_per_driver distinct trips (at most FORM_BID_SLOTS), the
+        earlier trip numbers being more popular
+    Returns a dictionary of the DataFrames: routes, seniority, charters, bids, force_rejections
+    """
+    rng = np.random.default_rng(seed)
+    driver_ids = rng.choice(900000, n_drivers, replace=False) + 100000
+    seniority = pd.DataFrame({
+        'FullName': [f'Driver {i}' for i in range(n_drivers)],
+        'DriverID': driver_ids,
+        'SeniorityNumber': np.arange(1, n_drivers + 1),
+    })
+
+    # standard routes, 1 or 2 per driver with routes
+    routes_per_driver = np.where(rng.random(n_drivers) < 0.7, rng.integers(1, 3, n_drivers), 0)
+    n_routes = int(routes_per_driver.sum())
+    departure = rng.integers(5 * 60, 15 * 60, n_routes)
+    duration = np.where(rng.random(n_routes) < 0.5, rng.integers(20, 80, n_routes), rng.integers(90, 240, n_routes))
+    days = rng.random((n_routes, len(dow_to_day))) < 0.6
+    days[~days.any(axis=1), dow_to_day['M']] = True
+    dow = np.full(n_routes, '', dtype=object)
+    for code, day in dow_to_day.items():
+        dow = dow + np.where(days[:, day], code, '')
+    routes = pd.DataFrame({
+        'Route identifier': rng.permutation(max(n_routes, 100000))[:n_routes] + 400000,
+        'Employee': np.repeat(driver_ids, routes_per_driver),
+        'Days of the week': dow,
+        'Depot departure time': clock_times(departure),
+        'Depot return time': clock_times(np.minimum(departure + duration, MINUTES_PER_DAY - 1)),
+    })
+
+    # charters over the week of Sunday 10/20/2024
+    pickup = rng.integers(6 * 60, 22 * 60, n_charters)
+    overnight = rng.random(n_charters) < overnight_share
+    ret = np.where(overnight, (pickup + rng.integers(300, 900, n_charters)) % MINUTES_PER_DAY,
+                   np.minimum(pickup + rng.integers(60, 360, n_charters), MINUTES_PER_DAY - 1))
+    ret = np.where(rng.random(n_charters) < 0.03, pickup, ret)
+    trip_date = pd.Timestamp('2024-10-20') + pd.to_timedelta(rng.integers(0, 7, n_charters), unit='D')
+    trips = np.arange(1, n_charters + 1)
+    charters = pd.DataFrame({
+        'Trip Number': trips,
+        'Buses': np.where(rng.random(n_charters) < 0.95, rng.integers(1, max_buses + 1, n_charters), 0),
+        'P/U Time': form_times(pickup),
+        'Return Time': form_times(ret),
+        'Trip Date': trip_date.strftime('%m/%d/%Y'),
+        'Pick Up Location': [f'School {t % 9}' for t in trips],
+        'Destination': [f'Place {t % 13}' for t in trips],
+    })
+
+    # bid form, distinct trips per driver drawn by popularity (Gumbel top-k), in blocks of drivers to bound memory
+    bidders = driver_ids[rng.random(n_drivers) < 0.85]
+    slots = min(bids_per_driver, FORM_BID_SLOTS, n_charters)
+    log_popularity = -0.3 * np.log(trips)
+    bid_spots = np.full((len(bidders), FORM_BID_SLOTS), np.nan)
+    block = max(1, 2 ** 22 // n_charters)
+    for first in range(0, len(bidders), block):
+        keys = log_popularity + rng.gumbel(size=(min(block, len(bidders) - first), n_charters))
+        top = np.argpartition(-keys, slots - 1, axis=1)[:, :slots]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1), axis=1)
+        bid_spots[first:first + len(top), :slots] = trips[top]
+    # each driver fills in a random number of their spots
+    n_bids = rng.integers(1, slots + 1, len(bidders))
+    bid_spots[np.arange(FORM_BID_SLOTS) >= n_bids[:, None]] = np.nan
+    bids = pd.concat([
+        pd.DataFrame({'ID': np.arange(1, len(bidders) + 1), 'Start time': '1/1/24 8:00', 'Email': 'x@y', 'Id': bidders}),
+        pd.DataFrame(bid_spots, columns=[str(spot) for spot in range(1, FORM_BID_SLOTS + 1)]),
+    ], axis=1)
+
+    # first choice of the first few bidders is force rejected
+    force_rejections = pd.DataFrame({'DriverID': bidders[:8], 'RouteID': bid_spots[:8, 0].astype(int)})
+    return {'routes': routes, 'seniority': seniority, 'charters': charters, 'bids': bids,
+            'force_rejections': force_rejections}
+
+
+INPUT_FILES = {'routes': 'routes.csv', 'seniority': 'seniority.csv', 'charters': 'charters.csv', 'bids': 'bids.csv',
+               'force_rejections': 'force.csv'}
+
+
+def write_inputs(inputs, out_dir):
+    """Writes the DataFrames of generate_inputs() to out_dir"""
+    os.makedirs(out_dir, exist_ok=True)
+    for key, file_name in INPUT_FILES.items():
+        inputs[key].to_csv(os.path.join(out_dir, file_name), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic input files for the benchmarks')
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--charters', type=int, default=800)
+    parser.add_argument('--bids-per-driver', type=int, default=20, help=f'at most {FORM_BID_SLOTS} (the form size)')
+    parser.add_argument('--max-buses', type=int, default=3, help='most buses a charter needs')
+    parser.add_argument('--overnight-share', type=float, default=0.15, help='share of charters returning the next day')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='synthetic_data', help='folder the csv files are written to')
+    args = parser.parse_args()
+    inputs = generate_inputs(args.drivers, args.charters, args.bids_per_driver, args.max_buses, args.overnight_share,
+                             args.seed)
+    write_inputs(inputs, args.out)
+    print(', '.join(f'{len(inputs[key])} {key}' for key in INPUT_FILES) + f' written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
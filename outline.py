@@ -1,82 +1,176 @@
 import algos.deferred_acceptance as def_ac
-import GS_Classes as gsc
 import GS_Functions as gsf
+from run_metrics import measure
+from stage_cache import frame_digest, run_stage
 import pandas as pd
 
-def gale_shapley_main(route_list, seniority, charters, bid_list, force_reject_tuples=None, max_hours=40, anti_padding = 30, sen_num = 0):
-    """Route List, Seniority, Charters, Bid_List: Dataframe of Routes, Seniority List, Charters, Bids from pandas
-    force_reject_tuples: Optional Dataframe of Force Rejections
-    max_hours: Maximum Hours Drivers can work
-    anti-padding: Take minutes off the start and end of routes (ie a route from 8:00 to 10:00 am with 30 minutes padding becomes 8:30 to 9:30 am)
-    sen_num: Seniority Number of the last allocation, this is not the person you start with, it is the person you end with
-    
-    Returns: drivers list object, assigned bids, all charters, unassigned charters, id:driver dict, and last employee"""
-    # Read data
-    std_routes, std_routes_to_drivers, all_drivers, driver_matches = gsf.initialize(route_list, seniority, anti_padding)
+CANCELLED_MESSAGE = "Allocation cancelled"
+ENGINES = ('rounds', 'batched', 'serial')  # allocation engines, see gale_shapley_main()
+
+
+def report_progress(progress, cancel, message, fraction):
+    """
+    Helper for gale_shapley_main(), passes the stage about to start to the progress callback (if any)
+    Returns True if the run has been cancelled
+    """
+    if progress is not None:
+        progress(message, fraction)
+    return cancel is not None and cancel.is_set()
+
+
+def prepare_model(route_list, seniority, charters, bid_list, anti_padding=30, sen_num=0, cache=None, metrics=None):
+    """
+    Helper for gale_shapley_main(), reads the input DataFrames into the allocation model (every stage before the allocation itself)
+    The Shiny app also calls it as soon as the inputs are uploaded, so with a cache the run only has to allocate
+    metrics: Optional run_metrics.RunMetrics the time of each stage is recorded into
+    Returns the allocation model (shared if it came from the cache, do not change it) or an error message
+    """
+    # Content hashes of the inputs, they are only needed to key the stage cache
+    routes_key = seniority_key = charters_key = bids_key = None
+    if cache is not None:
+        routes_key, seniority_key, charters_key, bids_key = (frame_digest(df) for df in (route_list, seniority, charters, bid_list))
+    with measure(metrics, 'initialize'):
+        std_intervals, driver_table = run_stage(cache, ('initialize', routes_key, seniority_key, anti_padding),
+                                                lambda: gsf.initialize(route_list, seniority, anti_padding))
     # Check if route list input correctly
-    if isinstance(driver_matches, str):
-        return None, None, driver_matches, None, None, None
+    if isinstance(driver_table, str):
+        return driver_table
     # Check charters read correctly
     try:
-        charter_routes, charter_id_to_routes = gsf.read_charters_routes(charters)
+        with measure(metrics, 'read_charters_routes'):
+            charter_table = run_stage(cache, ('charters', charters_key), lambda: gsf.read_charters_routes(charters))
     except:
-        return None, None, "Charter Routes P/U and Dropoff are not read as datetime variables. Ensure they are all datetime variables not things like TBD, TBA, or text in Excel type formatting", None, None, None
+        return "Charter Routes P/U and Dropoff are not read as datetime variables. Ensure they are all datetime variables not things like TBD, TBA, or text in Excel type formatting"
     # Check Seniority list input correctly
     try:
-        seniority_list = seniority["SeniorityNumber"].astype(str).to_list()
-        if sen_num != 0:
-            seniority_list = seniority_list[sen_num:] + seniority_list[:sen_num]
+        with measure(metrics, 'seniority_rank_table'):
+            seniority_rank = run_stage(cache, ('seniority_rank', seniority_key, sen_num),
+                                       lambda: gsf.seniority_rank_table(seniority, sen_num))
     except:
-        return None, None, "Issue occured when reading Seniority List. Check if the SeniorityNumber column is corrected named as SeniorityNumber (not something like Seniority_Number or Senioritynumber)", None, None, None
+        return "Issue occured when reading Seniority List. Check if the DriverID and SeniorityNumber columns are corrected named as DriverID and SeniorityNumber (not something like Seniority_Number or Senioritynumber)"
 
-    # Create route preferences (seniority list preference)
-    route_prefs = {(route,route.capacity):seniority_list for route in charter_routes}
-    driver_id = [d.ID for d in all_drivers]
-    
-    # Read charters
+    # Read charter bids
         # No errors here, assuming the charter list is the Microsoft Forms (aka no changes to the form)
-    gsf.read_charter_bids(driver_matches, bid_list, charter_id_to_routes)
+    with measure(metrics, 'read_charter_bids'):
+        bid_table = run_stage(cache, ('bids', bids_key, seniority_key, charters_key),
+                              lambda: gsf.read_charter_bids(driver_table, bid_list, charter_table))
 
-    # Remove bad bids
-    gsf.pre_processing(all_drivers, max_hours, driver_matches, charter_id_to_routes, force_reject_tuples,)
-    bids = [d.ActiveBids for d in all_drivers]
+    # Move drivers, charters and bids into arrays, every charter ranks drivers by the same seniority rank
+    with measure(metrics, 'build_allocation_model'):
+        return run_stage(cache, ('model', routes_key, seniority_key, charters_key, bids_key, anti_padding, sen_num),
+                         lambda: gsf.build_allocation_model(driver_table, std_intervals, charter_table, bid_table, seniority_rank))
 
-    # Load the driver bids
-    bid_preferences = {k:v for (k,v) in zip(driver_id, bids)}
+
+def allocate_routes(model, force_reject_tuples=None, max_hours=40, engine='rounds', progress=None, cancel=None, metrics=None):
+    """
+    Helper for gale_shapley_main(), runs the allocation on model (changed in place), see gale_shapley_main() for the arguments
+    Returns the ID of the last employee assigned a route and whether the run was cancelled
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    # Remove bad bids
+    if report_progress(progress, cancel, 'Pre-processing bids', 0.2):
+        return None, True
+    with measure(metrics, 'pre_processing'):
+        gsf.pre_processing(model, max_hours, force_reject_tuples)
+    if metrics is not None:
+        metrics.bids_removed_pre_processing = metrics.status_counts(model)
 
     # Helpful variables
     iteration = 0
-    bids_assigned = {}
-    old_routes = []
     last_empl = None
-    # Start gale-shapley algo
-    # Iterations set to less than 8 because drivers can only take 7 routes (technically yes there's an extra iteration included)
-    while iteration < 8 and len(route_prefs.keys()) > 0:
-        iteration+=1
-        # Deferred Acceptance call, get back the matches and route assignments
-        matches, new_routes, empl_assigned = def_ac.da(bid_preferences, route_prefs)
+    # Every charter ranks drivers by the same seniority list, so drivers can simply choose in seniority order
+    if engine == 'serial':
+        if report_progress(progress, cancel, 'Assigning routes in seniority order', 0.3):
+            return last_empl, True
+        with measure(metrics, 'serial_dictatorship'):
+            empl_assigned = gsf.serial_dictatorship(model, max_hours)
         if empl_assigned is not None:
-            last_empl = empl_assigned
-        # We don't use this for loop tbh
-        for driver in matches.keys():
-            if isinstance(matches[driver], gsc.Route):
-                matches[driver].AssignedDrivers.append(driver)
+            last_empl = model.driver_ids[empl_assigned]
+    else:
+        # Deferred acceptance keeps its state between iterations, each iteration only the drivers that just received a
+        # route propose again, picking up after the route they received
+        rounds = def_ac.DeferredAcceptanceRounds(model.bid_ptr, model.bid_charter, model.bid_active,
+                                                 model.charter_capacity, model.driver_rank,
+                                                 batched=(engine == 'batched'))
+        # Start gale-shapley algo
+        # Iterations set to less than 8 because drivers can only take 7 routes (technically yes there's an extra iteration included)
+        while iteration < 8 and model.charter_capacity.any():
+            iteration+=1
+            if report_progress(progress, cancel, f'Assigning routes, iteration {iteration} of 8', 0.3 + 0.075 * (iteration - 1)):
+                return last_empl, True
+            # Deferred Acceptance round, get back the drivers matched and the bid each of them is matched to
+            if metrics is None:
+                awarded, bids, empl_assigned = rounds.run_round()
+            else:
+                awarded, bids, empl_assigned = metrics.run_round(rounds, iteration)
+            if empl_assigned is not None:
+                last_empl = model.driver_ids[empl_assigned]
+
+            # End iterations loop once an iteration leaves every route's capacity unchanged
+            if len(awarded) == 0:
+                break
+
+            # post processing update variables
+            if metrics is None:
+                gsf.post_processing(model, awarded, bids, iteration, max_hours)
+            else:
+                metrics.post_processing(model, awarded, bids, iteration, max_hours)
+    return last_empl, False
 
-        # post processing update variables
-        bids_assigned, route_prefs = gsf.post_processing(all_drivers, new_routes, driver_matches, 
-                                                         iteration, bids_assigned, route_prefs, max_hours)
-        bids = [d.ActiveBids for d in all_drivers]
-        bid_preferences = {k:v for (k,v) in zip(driver_id, bids)}
 
-        # End iterations loop
-        if set(old_routes) == set(route_prefs.keys()):
-            break
-        old_routes = list(route_prefs.keys())
-    # Find all unassigned charters
-    unassigned_charters = []
-    for charter in charter_routes:
-        if charter.capacity > 0:
-            unassigned_charters.append(charter)
-    # Return drivers list object, assigned bids, all charters, unassigned charters, id:driver dict, and last employee
-    return all_drivers, bids_assigned, charter_routes, unassigned_charters, driver_matches, last_empl
-    
\ No newline at end of file
+def gale_shapley_main(route_list, seniority, charters, bid_list, force_reject_tuples=None, max_hours=40, anti_padding = 30, sen_num = 0, engine = 'rounds',
+                      progress=None, cancel=None, cache=None, metrics=None):
+    """Route List, Seniority, Charters, Bid_List: Dataframe of Routes, Seniority List, Charters, Bids from pandas
+    force_reject_tuples: Optional Dataframe of Force Rejections
+    max_hours: Maximum Hours Drivers can work
+    anti-padding: Take minutes off the start and end of routes (ie a route from 8:00 to 10:00 am with 30 minutes padding becomes 8:30 to 9:30 am)
+    sen_num: Seniority Number of the last allocation, this is not the person you start with, it is the person you end with
+    engine: 'rounds' runs deferred acceptance for up to 8 iterations, one route per driver per iteration.
+        'batched' runs the same iterations with every free driver proposing at once (same results, vectorized).
+        'serial' lets each driver in seniority order take all of their routes in a single pass (see gsf.serial_dictatorship),
+        which is possible because every charter ranks drivers by the same seniority list
+        Any other engine raises ValueError
+    progress: Optional function called with a message and the fraction of the run done (0 to 1) as each stage or iteration starts,
+        it is called from the thread running the allocation
+    cancel: Optional threading.Event, once it is set the run stops before the next stage or iteration and returns CANCELLED_MESSAGE
+        in place of the charters (like the input errors)
+    cache: Optional stage_cache.StageCache, each stage's output is reused from it when the inputs (by content) and the parameters
+        the stage uses are unchanged, e.g. a new max_hours reuses everything up to the allocation model
+    metrics: Optional run_metrics.RunMetrics filled in with the time of every stage and iteration, the proposals and rejections of
+        every round, the bids removed by each filter and the peak memory (nothing is measured without one)
+    
+    Returns: drivers list object, assigned bids, all charters, unassigned charters, id:driver dict, and last employee"""
+    if metrics is not None:
+        metrics.start()
+    model = None
+    try:
+        # Read data
+        if report_progress(progress, cancel, 'Reading input files', 0.0):
+            return None, None, CANCELLED_MESSAGE, None, None, None
+        model = prepare_model(route_list, seniority, charters, bid_list, anti_padding, sen_num, cache, metrics)
+        if isinstance(model, str):
+            return None, None, model, None, None, None
+        if cache is not None:
+            # the cached model is shared, the allocation runs on a copy of it
+            with measure(metrics, 'copy_model'):
+                model = model.copy()
+
+        last_empl, cancelled = allocate_routes(model, force_reject_tuples, max_hours, engine, progress, cancel, metrics)
+        if cancelled:
+            return None, None, CANCELLED_MESSAGE, None, None, None
+        # Build Driver and Route objects for the diagnostics and output tables
+        if report_progress(progress, cancel, 'Collecting results', 0.9):
+            return None, None, CANCELLED_MESSAGE, None, None, None
+        with measure(metrics, 'allocation_results'):
+            all_drivers, driver_matches, charter_routes, bids_assigned = gsf.allocation_results(model)
+        # Find all unassigned charters
+        unassigned_charters = []
+        for charter in charter_routes:
+            if charter.capacity > 0:
+                unassigned_charters.append(charter)
+        # Return drivers list object, assigned bids, all charters, unassigned charters, id:driver dict, and last employee
+        return all_drivers, bids_assigned, charter_routes, unassigned_charters, driver_matches, last_empl
+    finally:
+        if metrics is not None:
+            metrics.finish(model if not isinstance(model, str) else None)
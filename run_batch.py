@@ -0,0 +1,160 @@
+### Runs allocation jobs without the Shiny app, e.g. every depot and every week of a season overnight:
+##     python run_batch.py manifest.csv --workers 8 --output-dir batch_output
+## The manifest is a csv with one row per job and the columns
+##     name, routes, seniority, charters, bids: job name and paths of its input files (relative to the manifest)
+##     force_rejections (optional): path of the force-rejections file, left empty if there is none
+##     max_hours, anti_padding, sen_num (optional): parameters of the job, defaults as in the app (40, 30, 0)
+## Every job writes its assignments, unassigned charters and diagnostic sheet to output-dir/name
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import sys
+import time
+import GS_Functions as gsf
+from outline import ENGINES, gale_shapley_main
+import pandas as pd
+
+MANIFEST_FILES = ['routes', 'seniority', 'charters', 'bids']
+JOB_DEFAULTS = {'force_rejections': None, 'max_hours': 40, 'anti_padding': 30, 'sen_num': 0}
+# File of each input and the function validating it
+INPUT_VALIDATION = {
+    'routes': gsf.validate_standard_routes,
+    'seniority': gsf.validate_seniority,
+    'charters': gsf.validate_charters,
+    'bids': gsf.validate_bids,
+    'force_rejections': gsf.validate_force_rejects,
+}
+DIAGNOSTICS_FORMATS = ['csv', 'csv.gz', 'parquet']  # see gsf.export_diagnostics()
+
+
+def read_manifest(path):
+    """
+    Input: Path of the manifest csv
+    Output: List of jobs, dictionaries with the job name, absolute paths of its input files and its parameters
+    """
+    manifest = pd.read_csv(path, dtype={'name': str})
+    missing = [col for col in ['name'] + MANIFEST_FILES if col not in manifest.columns]
+    if missing:
+        raise ValueError(f"Manifest is missing columns: {', '.join(missing)}")
+    if manifest['name'].duplicated().any():
+        raise ValueError(f"Manifest has repeated job names: {sorted(set(manifest['name'][manifest['name'].duplicated()]))}")
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for row in manifest.to_dict('records'):
+        job = {**JOB_DEFAULTS, **{key: value for key, value in row.items() if pd.notna(value)}}
+        for key in MANIFEST_FILES + ['force_rejections']:
+            if job[key] is not None:
+                job[key] = os.path.join(base, job[key])
+        for key in ['max_hours', 'anti_padding', 'sen_num']:
+            job[key] = int(job[key])
+        jobs.append(job)
+    return jobs
+
+
+def run_job(job, output_dir, diagnostics_format='csv', engine='rounds'):
+    """
+    Runs one job of the manifest in a worker process and writes its outputs to output_dir/name
+    Returns a summary of the job: name, status (done or the error message), seconds taken, assignments and unassigned
+        charters written and seniority number of the last employee assigned
+    """
+    start = time.perf_counter()
+    summary = {'name': job['name'], 'status': 'done', 'seconds': None, 'assignments': None,
+               'unassigned_charters': None, 'last_seniority_number': None}
+    try:
+        data = {}
+        problems = []
+        for key, validate in INPUT_VALIDATION.items():
+            if job[key] is None:
+                data[key] = None
+                continue
+            data[key] = gsf.read_csv_file(job[key])
+            problems += [f"{os.path.basename(job[key])}: {problem}" for problem in validate(data[key])]
+        if not problems:
+            # Files checked against each other
+            references = {
+                'routes': gsf.validate_route_references(data['seniority'], data['routes']),
+                'bids': gsf.validate_bid_references(data['seniority'], data['charters'], data['bids']),
+            }
+            if data['force_rejections'] is not None:
+                references['force_rejections'] = gsf.validate_force_reject_references(
+                    data['seniority'], data['charters'], data['force_rejections'])
+            problems = [f"{os.path.basename(job[key])}: {problem}"
+                        for key, found in references.items() for problem in found]
+        if problems:
+            summary['status'] = '; '.join(problems)
+            return summary
+
+        all_drivers, bids_assigned, charters, unassigned_charters, driver_matches, last_empl = gale_shapley_main(
+            data['routes'], data['seniority'], data['charters'], data['bids'],
+            force_reject_tuples=gsf.force_reject_list(data['force_rejections']), max_hours=job['max_hours'],
+            anti_padding=job['anti_padding'], sen_num=job['sen_num'], engine=engine)
+        if all_drivers is None:
+            summary['status'] = charters
+            return summary
+
+        # Same outputs as the downloads of the app
+        job_dir = os.path.join(output_dir, job['name'])
+        os.makedirs(job_dir, exist_ok=True)
+        assignments = gsf.assignments_table(bids_assigned, data['seniority'], data['charters'])
+        assignments.to_csv(os.path.join(job_dir, 'Charter_Assignments.csv'), index=False)
+        unassigned = gsf.unassigned_table(unassigned_charters, driver_matches)
+        unassigned.to_csv(os.path.join(job_dir, 'Charter_Unassigned.csv'), index=False)
+        diagnostics_path = os.path.join(job_dir, f'diagnostic_sheet.{diagnostics_format}')
+        with open(diagnostics_path, 'w' if diagnostics_format == 'csv' else 'wb') as f:
+            for chunk in gsf.export_diagnostics(all_drivers, diagnostics_format):
+                f.write(chunk)
+
+        summary['assignments'] = len(assignments)
+        summary['unassigned_charters'] = len(unassigned)
+        if last_empl is not None:
+            summary['last_seniority_number'] = driver_matches[last_empl].SeniorityNumber
+    except Exception as e:
+        summary['status'] = f"{type(e).__name__}: {e}"
+    finally:
+        summary['seconds'] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the charter allocation for every job of a manifest, without the app')
+    parser.add_argument('manifest', help='csv with one row per job (see the top of run_batch.py)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of jobs run at the same time (default: one per core)')
+    parser.add_argument('--output-dir', default='batch_output', help='folder the outputs of every job are written to')
+    parser.add_argument('--diagnostics-format', choices=DIAGNOSTICS_FORMATS, default='csv',
+                        help='file format of the diagnostic sheets (parquet requires pyarrow)')
+    parser.add_argument('--engine', choices=ENGINES, default='rounds',
+                        help='allocation engine, see gale_shapley_main()')
+    args = parser.parse_args(argv)
+    # checked before any job runs, so a missing pyarrow does not leave every job half written
+    if args.diagnostics_format == 'parquet' and not gsf.parquet_available():
+        parser.error('--diagnostics-format parquet needs the pyarrow package (pip install pyarrow)')
+
+    jobs = read_manifest(args.manifest)
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    summaries = []
+    # Jobs run in worker processes, each one reads its own files so nothing large is sent between processes
+    workers = max(1, min(args.workers, len(jobs)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job, args.output_dir, args.diagnostics_format, args.engine) for job in jobs]
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            print(f"{summary['name']}: {summary['status']} in {summary['seconds']:.2f}s", flush=True)
+    elapsed = time.perf_counter() - start
+
+    # Summary of every job in manifest order
+    order = {job['name']: i for i, job in enumerate(jobs)}
+    summary_df = pd.DataFrame(sorted(summaries, key=lambda summary: order[summary['name']]))
+    summary_df = summary_df.astype({'assignments': 'Int64', 'unassigned_charters': 'Int64'})
+    summary_df.to_csv(os.path.join(args.output_dir, 'batch_summary.csv'), index=False)
+    failed = int((summary_df['status'] != 'done').sum())
+    print(f"{len(jobs)} jobs ({failed} failed) in {elapsed:.2f}s, {summary_df['seconds'].sum():.2f}s of job time "
+          f"on {workers} workers")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
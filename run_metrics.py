@@ -0,0 +1,146 @@
+from contextlib import contextmanager, nullcontext
+import sys
+import time
+import tracemalloc
+import GS_Classes as gsc
+import GS_Functions as gsf
+import numpy as np
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# Name of each filter removing bids in the metrics, by the bid status it leaves (see GS_Classes)
+FILTER_NAMES = {
+    gsc.TIME_CONFLICT: 'time_conflict',
+    gsc.HOUR_LIMIT: 'hour_limit',
+    gsc.SAME_DAY: 'same_day',
+    gsc.ROUTE_TAKEN: 'already_assigned',
+    gsc.FORCE_REJECTED: 'force_rejected',
+    gsc.NOT_TRAINED: 'not_trained',
+}
+
+
+def measure(metrics, name):
+    """
+    Context timing the stage name into metrics (a RunMetrics), or doing nothing if metrics is None
+    """
+    if metrics is None:
+        return nullcontext()
+    return metrics.stage(name)
+
+
+def process_peak_rss_mb():
+    """Peak resident memory of the whole process so far in MB, None where the resource module is not available"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class RunMetrics:
+    """
+    Record of one run of gale_shapley_main(), pass one as its metrics argument to fill it in:
+    wall time of every stage, and for every iteration the time of the deferred acceptance round and of the
+    post-processing, the proposals, rejections and matches of the round and the bids removed by each filter
+    (see FILTER_NAMES), the bids removed by each filter over the run and the peak memory
+    With trace_memory=True the peak memory allocated during the run is traced with tracemalloc, which slows the run
+    down, otherwise only the peak memory of the whole process is recorded (not on Windows)
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}  # stage name: seconds, in the order the stages ran
+        self.iterations = []  # one dictionary per iteration
+        self.bids_removed = {}  # filter name: bids removed over the run
+        self.bids_removed_pre_processing = {}  # filter name: bids removed before the allocation
+        self.bids = None
+        self.total_seconds = None
+        self.peak_traced_mb = None
+        self.process_peak_rss_mb = None
+        self._started_tracing = False
+        self._start = None
+
+    def start(self):
+        """Called as the run starts"""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+
+    def finish(self, model=None):
+        """Called as the run ends, with the allocation model to count the bids removed by each filter"""
+        self.total_seconds = time.perf_counter() - self._start
+        if model is not None:
+            self.bids = len(model.bid_status)
+            self.bids_removed = self.status_counts(model)
+        if tracemalloc.is_tracing() and self.trace_memory:
+            self.peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        self.process_peak_rss_mb = process_peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name):
+        """Times the stage name, a stage run again (e.g. every iteration) adds up"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    @staticmethod
+    def status_counts(model):
+        """Bids of the model with each of the filter statuses (see FILTER_NAMES)"""
+        counts = np.bincount(model.bid_status, minlength=len(gsc.STATUS_TEXT))
+        return {name: int(counts[status]) for status, name in FILTER_NAMES.items()}
+
+    def run_round(self, rounds, iteration):
+        """
+        Runs and records the deferred acceptance round of iteration (rounds is an
+        algos.deferred_acceptance.DeferredAcceptanceRounds), returns the output of rounds.run_round()
+        Proposals are counted from the position of every driver in the flat bid arrays before and after the round: the
+        active bids a driver went through are their proposals, and a proposal is rejected unless the driver still holds
+        it at the end of the round
+        """
+        next_bid_before = np.array(rounds.next_bid)
+        start = time.perf_counter()
+        awarded, bids, empl_assigned = rounds.run_round()
+        seconds = time.perf_counter() - start
+        self.stages['deferred_acceptance'] = self.stages.get('deferred_acceptance', 0.0) + seconds
+        active = np.concatenate([[0], np.cumsum(rounds.bid_active, dtype=np.int64)])
+        proposals = int((active[np.asarray(rounds.next_bid)] - active[next_bid_before]).sum())
+        self.iterations.append({'iteration': iteration, 'da_seconds': seconds, 'proposals': proposals,
+                                'rejections': proposals - len(awarded), 'matched': len(awarded)})
+        return awarded, bids, empl_assigned
+
+    def post_processing(self, model, awarded, bids, iteration, max_hours):
+        """
+        Runs and records gsf.post_processing() after the round of iteration, with the bids it removes by filter
+        """
+        removed_before = self.status_counts(model)
+        start = time.perf_counter()
+        gsf.post_processing(model, awarded, bids, iteration, max_hours)
+        seconds = time.perf_counter() - start
+        self.stages['post_processing'] = self.stages.get('post_processing', 0.0) + seconds
+        removed_after = self.status_counts(model)
+        self.iterations[-1]['post_processing_seconds'] = seconds
+        self.iterations[-1]['bids_removed'] = {name: removed_after[name] - removed_before[name]
+                                               for name in FILTER_NAMES.values()}
+
+    def to_dict(self):
+        """The record as plain Python values, ready for json.dumps()"""
+        return {
+            'total_seconds': self.total_seconds,
+            'stages': self.stages,
+            'iterations': self.iterations,
+            'bids': self.bids,
+            'bids_removed': self.bids_removed,
+            'bids_removed_pre_processing': self.bids_removed_pre_processing,
+            'peak_traced_mb': self.peak_traced_mb,
+            'process_peak_rss_mb': self.process_peak_rss_mb,
+        }
@@ -1,5 +1,7 @@
 # run_shiny.py
 
+import argparse
+import multiprocessing
 import os
 import socket
 import threading
@@ -21,14 +23,23 @@ def open_browser(host: str, port: int, timeout: float = 10.0):
     raise RuntimeError(f"Timed out waiting for {host}:{port}")
 
 if __name__ == "__main__":
+    # the parameter sweep starts worker processes, which re-run this file in the packaged app
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(description="Charter allocation app")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--no-browser", action="store_true", help="don't open the app in a browser tab")
+    args = parser.parse_args()
+
     # wrap_express_app wants a pathlib.Path
     app_path = Path(__file__).parent / "shiny_implementation.py"
     app = wrap_express_app(app_path)
 
-    host, port = "127.0.0.1", 8000
+    host, port = "127.0.0.1", args.port
 
     # 1) spawn a thread that will open exactly one tab
-    threading.Thread(target=open_browser, args=(host, port), daemon=True).start()
+    if not args.no_browser:
+        threading.Thread(target=open_browser, args=(host, port), daemon=True).start()
 
     # 2) serve in-process, no reload, no extra subprocesses
     run_app(
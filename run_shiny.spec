@@ -10,14 +10,14 @@ a = Analysis(
     ["run_shiny.py"],
     pathex=[],
     binaries=[],
+    # shiny_implementation.py is run from its source file by wrap_express_app, so its imports are not found by the
+    # analysis: the modules it loads are listed in hiddenimports, which also collects pandas and numpy for them
     datas=[
         ('shiny_implementation.py', '.'),
-        ('GS_Classes.py', '.'),
-        ('GS_Functions.py', '.'),
-        ('outline.py', '.'),
-        ('deferred_acceptance.py', '.')
     ] + faicons_datas + shiny_datas,
-    hiddenimports=['faicons', 'faicons._svg', 'faicons._cache'],
+    hiddenimports=['faicons', 'faicons._svg', 'faicons._cache',
+                   'GS_Classes', 'GS_Functions', 'outline', 'stage_cache', 'sweep', 'run_metrics',
+                   'algos.deferred_acceptance'],
     hookspath=[],
     runtime_hooks=[],
     excludes=[],
@@ -25,19 +25,19 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
+# One-folder build: a one-file executable unpacks pandas, numpy and the Python runtime to a temporary folder on every
+# launch, the folder build is unpacked once and starts straight away (run dist/run_shiny/run_shiny.exe)
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='run_shiny',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
-    runtime_tmpdir=None,
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -45,3 +45,14 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+
+# UPX compressed libraries have to be decompressed again on every launch
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='run_shiny',
+)
@@ -9,11 +9,124 @@ from shiny.render import DataGrid
 from faicons import icon_svg as icon
 from htmltools import tags
 from datetime import datetime
-import pandas as pd
-
-import GS_Classes as gsc # Custum classes for Gale Shapley allocation
-import GS_Functions as gsf # Helper functions for Gale Shapley
-from outline import gale_shapley_main # Completed Gale Shapley assignment function
+import asyncio
+import importlib.util
+import json
+import threading
+
+from stage_cache import StageCache, file_digest # Cache of parsed inputs and pipeline stages
+# pandas and the allocation modules (GS_Functions, outline, sweep, run_metrics) take as long to import as shiny itself,
+# so they are imported by the functions using them: the page is served without them, and they are loaded in the
+# background by the first upload
+
+# Parsed uploads and pipeline stages of this session, a re-run only redoes the stages whose inputs or parameters changed
+stage_cache = StageCache(max_bytes=256 * 2 ** 20)
+
+# Uploaded files, input id: (name of the file in messages, name of its validation function in GS_Functions)
+UPLOADS = {
+    'driver_prefs': ('Driver Bids', 'validate_bids'),
+    'driver_routes': ('Driver Static Routes', 'validate_standard_routes'),
+    'charter_routes': ('Charter List', 'validate_charters'),
+    'seniority_nums': ('Seniority List', 'validate_seniority'),
+    'force_rejections': ('Force-Rejections', 'validate_force_rejects'),
+}
+REQUIRED_UPLOADS = ['driver_prefs', 'driver_routes', 'charter_routes', 'seniority_nums']
+
+# The Parquet download is only offered with pyarrow installed, looked up without importing it (which would slow the
+# page down, see gsf.parquet_available())
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+def read_upload(input_id, path):
+    """
+    Reads and validates an uploaded csv, runs in a worker thread as soon as the file is uploaded
+    Returns the DataFrame (None if the file can't be read) and the list of problems found in it, reused if a file with
+    the same content was uploaded before (do not change the DataFrame)
+    """
+    import GS_Functions as gsf
+    file_name, validate_name = UPLOADS[input_id]
+    validate = getattr(gsf, validate_name)
+    def read_and_validate():
+        try:
+            df = gsf.read_csv_file(path)
+        except Exception:
+            return None, [f"{file_name} file is not a csv!"]
+        return df, [f"{file_name}: {problem}" for problem in validate(df)]
+    return stage_cache.get_or_compute(('upload', input_id, file_digest(path)), read_and_validate)
+
+def prepare_inputs(routes_df, seniority_df, charters_df, prefs_df, force_df, padding, sen_num):
+    """
+    Checks the standard routes, bids and force rejections (force_df, None if not uploaded) against the seniority and
+    charter lists and builds the allocation model into the stage cache, runs in a worker thread once every required file
+    has been read
+    Returns the list of problems found (empty if a run only has to allocate)
+    """
+    import GS_Functions as gsf
+    from outline import prepare_model
+    problems = [f"Driver Static Routes: {problem}" for problem in gsf.validate_route_references(seniority_df, routes_df)]
+    problems += [f"Driver Bids: {problem}" for problem in gsf.validate_bid_references(seniority_df, charters_df, prefs_df)]
+    if force_df is not None:
+        problems += [f"Force-Rejections: {problem}"
+                     for problem in gsf.validate_force_reject_references(seniority_df, charters_df, force_df)]
+    if problems:
+        return problems
+    model = prepare_model(routes_df, seniority_df, charters_df, prefs_df, padding, sen_num, cache=stage_cache)
+    if isinstance(model, str):
+        return [model]
+    return []
+
+def upload_task(input_id):
+    """Creates the background task reading the file of input_id, started every time a file is uploaded"""
+    @reactive.extended_task
+    async def read_task(path):
+        return await asyncio.to_thread(read_upload, input_id, path)
+
+    @reactive.effect
+    def start_read():
+        files = input[input_id]()
+        if files:
+            read_task(files[0]['datapath'])
+    return read_task
+
+# Every upload is read and validated in its own worker thread, so the files are read at the same time
+upload_tasks = {input_id: upload_task(input_id) for input_id in UPLOADS}
+
+def uploaded_inputs():
+    """
+    DataFrames of the uploaded files (input id: DataFrame) once every required file has been read without problems
+    Returns the DataFrames and None, or None and the reason they're not ready
+    """
+    uploaded = [input_id for input_id in UPLOADS if input[input_id]()]
+    if not all(input_id in uploaded for input_id in REQUIRED_UPLOADS):
+        return None, 'Please upload all four required files'
+    if any(upload_tasks[input_id].status() in ('initial', 'running') for input_id in uploaded):
+        return None, 'Input files are still being read, try again in a moment'
+    if any(upload_tasks[input_id].status() != 'success' or upload_tasks[input_id].result()[1] for input_id in uploaded):
+        return None, 'Fix the problems with the input files listed above'
+    return {input_id: upload_tasks[input_id].result()[0] for input_id in uploaded}, None
+
+def sweep_values(text):
+    """Whole numbers typed into a sweep input, separated by commas (ValueError if one is not a whole number)"""
+    return list(dict.fromkeys(int(value) for value in text.replace(' ', '').split(',') if value))
+
+@reactive.extended_task
+async def prepare_task(*args):
+    """Runs prepare_inputs() in a worker thread"""
+    return await asyncio.to_thread(prepare_inputs, *args)
+
+# Build the allocation model as soon as the files are read (and again when the padding or seniority number changes)
+@reactive.effect
+def start_prepare():
+    inputs, _ = uploaded_inputs()
+    padding, sen_num = input.padding(), input.seniority()
+    if inputs is None or padding is None or sen_num is None:
+        return
+    prepare_task(inputs['driver_routes'], inputs['seniority_nums'], inputs['charter_routes'], inputs['driver_prefs'],
+                 inputs.get('force_rejections'), int(padding), int(sen_num))
+
+# Create custom naming conventions for .csv files
+y=datetime.now().year
+m=datetime.now().month
+d=datetime.now().day
 
 # Create page title
 ui.page_opts(title='NACSB Bus Assignment')
@@ -115,232 +228,280 @@ with ui.card():
                     'RouteID': (50)
                     """)
 
+    # Show how far each upload has got and every problem found in them, before anything is run
+    @render.ui
+    def upload_status():
+        lines = []
+        for input_id, (file_name, _) in UPLOADS.items():
+            if not input[input_id]():
+                continue
+            task = upload_tasks[input_id]
+            if task.status() in ('initial', 'running'):
+                lines.append(f"{file_name}: reading file...")
+            elif task.status() != 'success':
+                lines.append(f"{file_name}: file could not be read")
+            else:
+                df, problems = task.result()
+                lines.extend(problems or [f"{file_name}: {len(df)} rows read"])
+        if prepare_task.status() == 'running':
+            lines.append('Preparing the allocation...')
+        elif uploaded_inputs()[0] is not None:
+            if prepare_task.status() == 'success':
+                lines.extend(prepare_task.result() or ['Ready to run'])
+            elif prepare_task.status() == 'error':
+                error = prepare_task.error.get()
+                lines.append(f"Allocation could not be prepared from these files ({type(error).__name__}: {error}), "
+                             "check that they match the templates")
+        return tags.div(*[tags.div(line) for line in lines])
+
     # Numerical inputs
     ui.input_numeric("max_hours", "Input maximum hours", value=40, min=0, step=1) # Input maximum hours each driver can work
     ui.input_numeric("padding", "Input time padding (minutes to cut off from route end time)", value = 30, min = 0, step = 1) # Input time padding, set value is 30
     ui.input_numeric("seniority", "Input Seniority Number from last allocation (not last seniority number + 1)", value = 0, step = 1) # Input last seniority number
 
-    # Button that lets us run the Gale Shapley with our uploaded data
+    # Button that lets us run the Gale Shapley with our uploaded data, and one to stop a run that is in progress
     ui.input_action_button("gs_run", "Run Driver Assignments")
+    ui.input_action_button("gs_cancel", "Cancel Run")
     
     # Store status messages as reactive.Value so we can set and dispplay them later
     status_msg = reactive.Value("")
     status_msg2 = reactive.Value("")
 
+    # Progress of the run in the background, written by the worker thread (a plain dict, not reactive) and the
+    # cancel flag of the current run
+    run_progress = {'message': '', 'fraction': 0.0}
+    run_cancel = threading.Event()
+
     # Create a render.text function that displays the status messages assigned above (they're blank to begin with)
     @render.text
     def status_text():
+        # While a run is in progress show how far it has got, checking again every quarter second
+        if allocation_task.status() == 'running':
+            reactive.invalidate_later(0.25)
+            return f"{run_progress['message']} ({run_progress['fraction']:.0%})"
+        if allocation_task.status() == 'error':
+            error = allocation_task.error.get()
+            return f"Allocation failed ({type(error).__name__}: {error}), check that the input files match the templates"
         return status_msg.get()
 
+    # Stop the current run before its next stage or iteration
+    @reactive.effect
+    @reactive.event(input.gs_cancel)
+    def cancel_gale_shapley():
+        run_cancel.set()
+
+# Create a ui.card to compare allocations with different parameters before publishing one
+with ui.card():
+    ui.card_header('Parameter Sweep - Compare Runs Before Publishing')
+
+    # Values to try for each parameter, every combination of them is run
+    ui.input_text("sweep_max_hours", "Maximum hours to try (separated by commas)", value="35, 40, 45")
+    ui.input_text("sweep_padding", "Time paddings to try (separated by commas)", value="30")
+    ui.input_text("sweep_seniority", "Seniority Numbers from last allocation to try (separated by commas)", value="0")
+
+    ui.input_action_button("sweep_run", "Run Sweep")
+    ui.input_action_button("sweep_cancel", "Cancel Sweep")
+
+    sweep_msg = reactive.Value("")
+    # Progress of the sweep, written by the worker thread (a plain dict, not reactive), and the cancel flag of the sweep
+    sweep_progress = {'message': '', 'fraction': 0.0}
+    sweep_cancel = threading.Event()
+
+    @render.text
+    def sweep_status():
+        if sweep_task.status() == 'running':
+            reactive.invalidate_later(0.25)
+            return f"{sweep_progress['message']} ({sweep_progress['fraction']:.0%})"
+        if sweep_task.status() == 'error':
+            error = sweep_task.error.get()
+            return f"Sweep failed ({type(error).__name__}: {error}), check that the input files match the templates"
+        return sweep_msg.get()
+
+    @reactive.effect
+    @reactive.event(input.sweep_cancel)
+    def cancel_sweep():
+        sweep_cancel.set()
+
+    @reactive.effect
+    @reactive.event(input.sweep_run)
+    def start_sweep():
+        """Runs the allocation for every combination of the values typed in, on the uploads read for the main run"""
+        inputs, message = uploaded_inputs()
+        if inputs is None:
+            sweep_msg.set(message)
+            return
+        try:
+            grid = [sweep_values(input.sweep_max_hours()), sweep_values(input.sweep_padding()),
+                    sweep_values(input.sweep_seniority())]
+        except ValueError:
+            sweep_msg.set('Sweep values must be whole numbers separated by commas')
+            return
+        if not all(grid):
+            sweep_msg.set('Enter at least one value for each sweep parameter')
+            return
+        import GS_Functions as gsf
+        force_reject_list = gsf.force_reject_list(inputs.get('force_rejections'))
+
+        sweep_cancel.clear()
+        set_sweep_progress('Starting sweep', 0.0)
+        sweep_task(inputs['driver_routes'], inputs['seniority_nums'], inputs['charter_routes'], inputs['driver_prefs'],
+                   force_reject_list, *grid)
+
+    def set_sweep_progress(message, fraction):
+        """Progress callback of sweep(), called from the worker thread"""
+        sweep_progress['message'] = message
+        sweep_progress['fraction'] = fraction
+
+    def run_sweep(routes_df, seniority_df, charters_df, prefs_df, force_reject_list, max_hours, padding, sen_num):
+        """Runs the sweep, returns an error message or the comparison table"""
+        from sweep import sweep
+        return sweep(routes_df, seniority_df, charters_df, prefs_df, force_reject_list, max_hours=max_hours,
+                     anti_padding=padding, sen_num=sen_num, progress=set_sweep_progress, cancel=sweep_cancel,
+                     cache=stage_cache)
+
+    @reactive.extended_task
+    async def sweep_task(*args):
+        """Runs run_sweep() in a worker thread, the runs themselves are spread over worker processes"""
+        return await asyncio.to_thread(run_sweep, *args)
+
+    # Comparison table of the sweep, one row per combination of parameters
+    @render.data_frame
+    def sweep_table():
+        result = sweep_task.result()
+        if isinstance(result, str):
+            # Input error or cancelled sweep
+            sweep_msg.set(result)
+            return
+        sweep_msg.set(f'Sweep done, {len(result)} runs compared')
+        return DataGrid(result, summary=True)
+
+    @render.download(label="Download Sweep Comparison",
+                     filename=f"{y}_{m}_{d}_Parameter_Sweep.csv")
+    def download_sweep():
+        if sweep_task.status() != 'success' or isinstance(sweep_task.result(), str):
+            yield ""
+        else:
+            yield sweep_task.result().to_csv(index=False)
+
 # Create another ui.card for the outputs
 with ui.card():
     ui.card_header('Output Table - Press Column Header to Sort')
 
     # Reactive storage for Dataframes to be displayed later
-    stored_diagnostic_df=reactive.Value(None)
+    stored_drivers=reactive.Value(None) # Drivers of the last run, the diagnostic sheet is built from them when downloaded
     stored_bid_assignments = reactive.Value(None)
     stored_charter_unassigned = reactive.Value(None)
+    stored_metrics = reactive.Value(None) # Metrics of the last run (see run_metrics.RunMetrics.to_dict())
 
-    # Create a dataframe render
-    @render.data_frame 
+    @reactive.effect
     @reactive.event(input.gs_run) # This sets the below function to run only when the "Run Driver Assignemnts" button is clicked
-    def run_gale_shapley():
+    def start_gale_shapley():
         """
-        Executes when the Run button is clicked:
-        1. Validates uploads and required columns
-        2. Reads each CSV into a DataFrame
-        3. Runs the Gale-Shapley matching algorithm
-        4. Prepares DataFrames for display and download
+        Executes when the Run button is clicked, the uploads have already been read and validated in the background
+        (see read_upload()) and the allocation model built (see prepare_inputs()):
+        1. Checks the uploads are all read without problems
+        2. Starts the Gale-Shapley matching algorithm in the background (see allocation_task())
         """
-
-        # Makes sure all four required files are uploaded
-        if not all([input.driver_prefs(), 
-                    input.driver_routes(),
-                    input.charter_routes(),
-                    input.seniority_nums()]):
-            status_msg.set('Please upload all four required files')
+        inputs, message = uploaded_inputs()
+        if inputs is None:
+            status_msg.set(message)
             return
-
-        status_msg.set('Running Gale Shapley')
-
-        # Read and validate driver preferences, we don't check for specific columns here though, as the data is taken right from the Microsoft Form.
-        try:
-            prefs_csv = input.driver_prefs()[0]
-            prefs_path=prefs_csv['datapath']
-            prefs_df=pd.read_csv(prefs_path)
-        except:
-            status_msg.set("Driver Bids file is not a csv!")
+        # Problems found when checking the files against each other
+        if prepare_task.status() == 'error' or (prepare_task.status() == 'success' and prepare_task.result()):
+            status_msg.set('Fix the problems with the input files listed above')
             return
 
-        # Read and validate static routes
-        try:
-            routes_csv = input.driver_routes()[0]
-            routes_path=routes_csv['datapath']
-            routes_df=pd.read_csv(routes_path)
-        except:
-            # Check that error catch works
-            status_msg.set("Driver Routes file is not a csv!")
-            return
-        
-        # Check that required columns are in the static route csv
-        try:
-            req_columns = set(["Route identifier", 'Days of the week', 'Depot departure time', 'Depot return time'])
-            missing = req_columns - set(routes_df.columns)
-            if missing:
-                status_msg.set(f"File for Driver Static Routes is missing columns: {', '.join(missing)}")
-                return
-        except:
-            status_msg.set("Driver Static Routes csv does not have the correct columns")
+        # Force-reject file as a list of (DriverID, RouteID) tuples
+        import GS_Functions as gsf
+        force_reject_list = gsf.force_reject_list(inputs.get('force_rejections'))
 
-        # Read and validate charter routes
-        try:
-            charters_csv = input.charter_routes()[0]
-            charters_path=charters_csv['datapath']
-            charters_df=pd.read_csv(charters_path)
-        except:
-            try:
-                # Tries a different encoding. Likely causes an issue with the code breaking
-                charters_df = pd.read_csv(charters_path, encoding = "ISO-8859-1")
-            except:
-                status_msg.set("Charter List file is not a csv!")
-                return
-            
-        # Make sure required columns are in charter route csv
-        try:
-            req_columns = set(["Buses", "Trip Number", "P/U Time", "Return Time"])
-            missing = req_columns - set(charters_df.columns)
-            if missing:
-                status_msg.set(f"File for Charter List is missing columns: {', '.join(missing)}")
-                return
-        except:
-            status_msg.set("Driver Static Routes csv does not have the correct columns")
+        # Start the core gale-shapley algorithm in the background, the app stays responsive while it runs
+        run_cancel.clear()
+        set_progress('Starting allocation', 0.0)
+        allocation_task(inputs['driver_routes'], inputs['seniority_nums'], inputs['charter_routes'], inputs['driver_prefs'],
+                        force_reject_list, int(input.max_hours()),
+                        int(input.padding()), int(input.seniority()), input.trace_memory())
 
-        # Read and validate seniority numbers
-        try:
-            seniority_csv = input.seniority_nums()[0]
-            seniority_path=seniority_csv['datapath']
-            seniority_df=pd.read_csv(seniority_path)
-        except:
-            status_msg.set("Seniority List file is not a csv!")
-            return
-        
-        # Ensure required columns are in seniority list csv
-        try:
-            req_columns = set(['FullName', 'DriverID', 'SeniorityNumber'])
-            missing = req_columns - set(seniority_df.columns)
-            if missing:
-                status_msg.set(f"File for Seniority List is missing columns: {', '.join(missing)}")
-                return
-        except:
-            status_msg.set("Seniority list csv does not have the correct columns")
-
-        # Read force-reject csv file
-        if input.force_rejections():
-            force_reject_csv=input.force_rejections()[0]
-            force_reject_path=force_reject_csv['datapath']
-            force_reject_df=pd.read_csv(force_reject_path)
-
-            # Make it so all entries are ints, not strings
-            force_reject_df['DriverID'] = force_reject_df['DriverID'].astype(int)
-            force_reject_df['RouteID']  = force_reject_df['RouteID'].astype(int)
-
-            # Use itertuples to construct the force-rejection df
-            force_reject_list=list(
-                force_reject_df[['DriverID','RouteID']].itertuples(index=False, name=None)
-            )
-        else:
-            force_reject_list=None
-        
-
-        status_msg.set('Passed csvs')
+    def set_progress(message, fraction):
+        """Progress callback of gale_shapley_main(), called from the worker thread"""
+        run_progress['message'] = message
+        run_progress['fraction'] = fraction
 
+    def run_allocation(routes_df, seniority_df, charters_df, prefs_df, force_reject_list, max_hours, padding, sen_num,
+                       trace_memory):
+        """
+        Runs the Gale-Shapley matching algorithm and prepares DataFrames for display and download
+        Returns an error message, or a dict of the outputs and the metrics of the run
+        """
+        import GS_Functions as gsf
+        from outline import gale_shapley_main
+        from run_metrics import RunMetrics, measure
+        metrics = RunMetrics(trace_memory=trace_memory)
         # Execute core gale-shapley algorithm
         all_drivers, bids_assigned, charters, unassigned_charters, driver_matches, last_empl = gale_shapley_main(routes_df, seniority_df, charters_df,
-                                                               prefs_df, force_reject_tuples=force_reject_list, max_hours=int(input.max_hours()),
-                                                               anti_padding=int(input.padding()), sen_num=int(input.seniority()))
+                                                               prefs_df, force_reject_tuples=force_reject_list, max_hours=max_hours,
+                                                               anti_padding=padding, sen_num=sen_num,
+                                                               progress=set_progress, cancel=run_cancel, cache=stage_cache,
+                                                               metrics=metrics)
         if all_drivers is None:
-            status_msg.set(charters)
-
-        # Create diagnostic sheet
-        diagnostic_df=gsf.diagnostics_sheet(all_drivers)
-        stored_diagnostic_df.set(diagnostic_df)
-
-        status_msg.set('Algorithm completed, creating table')
-
-        # Prepare the main assignment table
-        rows = []
-        for route, driver_row in bids_assigned.items():
-            for i in range(len(driver_row)):
-                # Driver details
-                driver=driver_row[i]
-                driver_name=seniority_df[seniority_df['SeniorityNumber']==driver.SeniorityNumber]['FullName'].item()
-                driver_id=seniority_df[seniority_df['SeniorityNumber']==driver.SeniorityNumber]['DriverID'].item()
-                # Route details
-                charter_pickup=charters_df[charters_df['Trip Number']==route.ID]['P/U Time'].item().time()
-                charter_return=charters_df[charters_df['Trip Number']==route.ID]['Return Time'].item().time()
-                charter_date=charters_df[charters_df['Trip Number']==route.ID]['Trip Date'].item()
-                charter_location=charters_df[charters_df['Trip Number']==route.ID]['Pick Up Location'].item()
-                charter_destination=charters_df[charters_df['Trip Number']==route.ID]['Destination'].item()
-
-                route_id_assignment = str(route.ID)+str(chr(ord('`')+(route.AssignedDrivers.index(driver.ID)+1))).upper()
-                if len(route.AssignedDrivers) < 2:
-                    route_id_assignment = route.ID
-                
-                # Append the dictionary onto our rows list
-                rows.append({
-                "Driver Name": driver_name,
-                "Seniority Number": driver.SeniorityNumber,
-                "Driver ID": driver_id,
-                "Route ID": route_id_assignment,
-                "Route Pickup Location": charter_location,
-                "Route Destination": charter_destination,
-                "Charter Date": charter_date,
-                "Pick Up Time": charter_pickup,
-                "Return Time": charter_return
-                })
-        
-        # Turn rows into a Dataframe, and sort by seniority number
-        output_df = pd.DataFrame(rows).sort_values(by='Seniority Number')
-        stored_bid_assignments.set(output_df)
-
-        # Create the dataframe for unassigned charters and display it
-        charter_rows = []
-        for charter in unassigned_charters:
-            drivers = [driver_matches[driver].Name for driver in charter.AssignedDrivers]
-            charter_rows.append({
-                "Charter ID": charter.ID,
-                "Charter Left Unassigned": charter.capacity,
-                "Charter Drivers Assigned": ", ".join(drivers)
-            })
-        stored_charter_unassigned.set(pd.DataFrame(charter_rows))
+            return charters
+
+        set_progress('Algorithm completed, creating tables', 0.95)
+
+        # Prepare the main assignment table, sorted by seniority number
+        with measure(metrics, 'assignments_table'):
+            output_df = gsf.assignments_table(bids_assigned, seniority_df, charters_df)
+
+        # Create the dataframe for unassigned charters
+        with measure(metrics, 'unassigned_table'):
+            unassigned_df = gsf.unassigned_table(unassigned_charters, driver_matches)
 
         # Find the last seniority number to be assigned a route
-        status_msg.set('Allocation Process Done!')
         last_id = None
         if last_empl is not None:
             last_id = driver_matches[last_empl].SeniorityNumber
-        status_msg2.set('The last employee assigned is seniority number: '+str(last_id))
+        return {'drivers': all_drivers, 'assignments': output_df, 'unassigned': unassigned_df,
+                'last_id': last_id, 'metrics': metrics.to_dict()}
+
+    @reactive.extended_task
+    async def allocation_task(*args):
+        """Runs run_allocation() in a worker thread so the app stays responsive"""
+        return await asyncio.to_thread(run_allocation, *args)
+
+    # Create a dataframe render, updated when a run finishes
+    @render.data_frame
+    def run_gale_shapley():
+        result = allocation_task.result()
+        if isinstance(result, str):
+            # Input error or cancelled run
+            status_msg.set(result)
+            return
+
+        # Keep the drivers for the diagnostic sheet downloads
+        stored_drivers.set(result['drivers'])
+        stored_bid_assignments.set(result['assignments'])
+        stored_charter_unassigned.set(result['unassigned'])
+        stored_metrics.set(result['metrics'])
+
+        status_msg.set('Allocation Process Done!')
+        status_msg2.set('The last employee assigned is seniority number: '+str(result['last_id']))
 
         # Returns a "Datagrid", Shinys way of displaying tables
         return DataGrid(
-            output_df,
+            result['assignments'],
             height=800,
             summary=True
             )
     
     # Show the unassigned charters that we created in the previous function
     @render.data_frame
-    @reactive.event(input.gs_run)
     def show_dataframe():
+        if stored_charter_unassigned.get() is None:
+            return
         return DataGrid(
             stored_charter_unassigned.get(),height = 400, summary = True
         )
 
-    # Create custom naming conventions for .csv files
-    y=datetime.now().year
-    m=datetime.now().month
-    d=datetime.now().day
-    
     # Create the downloadable csv for charter assignments
     @render.download(label="Download Charter Assignments Sheet",
                      filename=f"{y}_{m}_{d}_Charter_Assignments.csv")
@@ -361,17 +522,93 @@ with ui.card():
         else:
            yield downloadable_diagnostic.to_csv(index=False)
     
-    # Create the downloadable csv for Diagnostic Sheet
+    # Create the downloadable csv for Diagnostic Sheet, streamed to the browser in chunks
     @render.download(label="Download Diagnostic Sheet",
                      filename=f"{y}_{m}_{d}_diagnostic_sheet.csv")
     def download_csv():
-        downloadable_diagnostic=stored_diagnostic_df.get()
-        if downloadable_diagnostic is None:
+        diagnostic_drivers=stored_drivers.get()
+        if diagnostic_drivers is None:
             yield ""
         else:
-           yield downloadable_diagnostic.to_csv(index=False)
+           import GS_Functions as gsf
+           yield from gsf.export_diagnostics(diagnostic_drivers, 'csv')
+
+    # Same Diagnostic Sheet compressed with gzip
+    @render.download(label="Download Diagnostic Sheet (gzip)",
+                     filename=f"{y}_{m}_{d}_diagnostic_sheet.csv.gz")
+    def download_csv_gz():
+        diagnostic_drivers=stored_drivers.get()
+        if diagnostic_drivers is None:
+            yield b""
+        else:
+           import GS_Functions as gsf
+           yield from gsf.export_diagnostics(diagnostic_drivers, 'csv.gz')
+
+    # Same Diagnostic Sheet as a Parquet file, if pyarrow is installed
+    if PARQUET_AVAILABLE:
+        @render.download(label="Download Diagnostic Sheet (Parquet)",
+                         filename=f"{y}_{m}_{d}_diagnostic_sheet.parquet")
+        def download_parquet():
+            diagnostic_drivers=stored_drivers.get()
+            if diagnostic_drivers is None:
+                yield b""
+            else:
+               import GS_Functions as gsf
+               yield from gsf.export_diagnostics(diagnostic_drivers, 'parquet')
 
     # Display the last seniority number
     @render.text
     def status_text2():
         return status_msg2.get()
+
+# Collapsible panel with the timings and counters of the last run, to find which part of a slow run is to blame
+with ui.accordion(open=False):
+    with ui.accordion_panel("Run Metrics"):
+        ui.input_checkbox("trace_memory", "Trace peak memory of the next run (makes the run slower)", value=False)
+
+        @render.text
+        def metrics_summary():
+            metrics = stored_metrics.get()
+            if metrics is None:
+                return 'Run the driver assignments to see their metrics'
+            memory = metrics['peak_traced_mb'] if metrics['peak_traced_mb'] is not None else metrics['process_peak_rss_mb']
+            memory_text = 'not measured' if memory is None else f"{memory:.1f} MB" + (
+                ' (allocated during the run)' if metrics['peak_traced_mb'] is not None else ' (whole app)')
+            return (f"Allocation took {metrics['total_seconds']:.3f}s over {len(metrics['iterations'])} iterations "
+                    f"for {metrics['bids']} bids, peak memory {memory_text}")
+
+        # Wall time of every stage
+        @render.data_frame
+        def metrics_stages():
+            metrics = stored_metrics.get()
+            if metrics is None:
+                return
+            import pandas as pd
+            return DataGrid(pd.DataFrame({'Stage': list(metrics['stages']),
+                                          'Seconds': [round(seconds, 4) for seconds in metrics['stages'].values()]}))
+
+        # Time, proposals, rejections and bids removed by each filter of every iteration
+        @render.data_frame
+        def metrics_iterations():
+            metrics = stored_metrics.get()
+            if metrics is None or not metrics['iterations']:
+                return
+            import pandas as pd
+            return DataGrid(pd.json_normalize(metrics['iterations']).round(4))
+
+        # Bids removed by each filter, before the allocation and over the whole run
+        @render.data_frame
+        def metrics_filters():
+            metrics = stored_metrics.get()
+            if metrics is None:
+                return
+            import pandas as pd
+            return DataGrid(pd.DataFrame({'Filter': list(metrics['bids_removed']),
+                                          'Removed in Pre-processing': list(metrics['bids_removed_pre_processing'].values()),
+                                          'Removed in Total': list(metrics['bids_removed'].values())}))
+
+        @render.download(label="Download Run Metrics (JSON)",
+                         filename=f"{y}_{m}_{d}_run_metrics.json")
+        def download_metrics():
+            metrics = stored_metrics.get()
+            yield "" if metrics is None else json.dumps(metrics, indent=2)
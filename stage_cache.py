@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import hashlib
+import sys
+import threading
+
+
+def file_digest(path):
+    """
+    Input: Path of a file
+    Output: Hash of the file's content, the same file uploaded twice has the same digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_digest(df):
+    """
+    Input: DataFrame
+    Output: Hash of the DataFrame's content (column names, index and values)
+    """
+    if df is None:
+        return None
+    import pandas as pd
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(list(df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def object_size(obj):
+    """
+    Approximate memory in bytes held by a cached stage output (DataFrames, arrays, containers and plain objects)
+    """
+    # imported here so the app can create its cache without loading pandas (see shiny_implementation.py)
+    import numpy as np
+    import pandas as pd
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (tuple, list)):
+        return sys.getsizeof(obj) + sum(object_size(item) for item in obj)
+    if isinstance(obj, dict):
+        # keys and values of the dicts kept here are small scalars
+        return sys.getsizeof(obj) + 64 * len(obj)
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + sum(object_size(value) for value in vars(obj).values())
+    return sys.getsizeof(obj)
+
+
+class StageCache:
+    """
+    Memoizes the outputs of the allocation pipeline stages (parsed files, interval tables, allocation model, ...)
+    under keys made of the content hashes of their inputs and the parameters each stage uses, so re-running with
+    other parameters skips every stage upstream of the parameters that changed.
+    Entries are evicted least recently used first once their total size is over max_bytes. Cached outputs are shared,
+    callers must not change them (copy anything they need to change).
+    """
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key: (value, size), least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.pending = {}  # key: threading.Event set once the thread computing that key is done
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached output for key, or runs compute() and caches its output
+        A thread asking for a key another thread is already computing waits for that output instead of computing it
+        again (e.g. a run started while the uploads are still being prepared in the background)
+        An output larger than max_bytes on its own is returned without being cached
+        """
+        while True:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self.entries[key][0]
+                pending = self.pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    self.pending[key] = threading.Event()
+                    break
+            # if the other thread fails or its output is too large to cache, this thread computes it on the next pass
+            pending.wait()
+        try:
+            value = compute()
+            size = object_size(value)
+            with self.lock:
+                if size <= self.max_bytes:
+                    self.entries[key] = (value, size)
+                    self.total_bytes += size
+                    while self.total_bytes > self.max_bytes:
+                        _, (_, evicted_size) = self.entries.popitem(last=False)
+                        self.total_bytes -= evicted_size
+        finally:
+            with self.lock:
+                self.pending.pop(key).set()
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+def run_stage(cache, key, compute):
+    """
+    Returns compute(), through cache (see StageCache) if one is given
+    key: stage name followed by the digests and parameters the stage depends on
+    """
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(key, compute)
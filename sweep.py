@@ -0,0 +1,105 @@
+import itertools
+import multiprocessing
+import os
+import GS_Functions as gsf
+from outline import CANCELLED_MESSAGE, allocate_routes, prepare_model, report_progress
+from stage_cache import StageCache
+import pandas as pd
+
+SWEEP_PARAMETERS = ['max_hours', 'anti_padding', 'sen_num']
+
+# Allocation models of the sweep (keyed by anti_padding and sen_num), forced rejections and engine, set once in each
+# worker process by init_sweep_worker()
+sweep_inputs = {}
+
+
+def init_sweep_worker(models, force_reject_tuples, engine):
+    """
+    Initializer of the sweep worker processes, the models are sent to each worker once rather than with every run
+    """
+    sweep_inputs['models'] = models
+    sweep_inputs['force_reject_tuples'] = force_reject_tuples
+    sweep_inputs['engine'] = engine
+
+
+def sweep_run(max_hours, anti_padding, sen_num):
+    """
+    Runs the allocation of one combination of parameters in a worker process
+    Returns the combination followed by the summary of its allocation (see gsf.allocation_summary())
+    """
+    model = sweep_inputs['models'][anti_padding, sen_num].copy()
+    last_empl, _ = allocate_routes(model, sweep_inputs['force_reject_tuples'], max_hours, sweep_inputs['engine'])
+    return {'max_hours': max_hours, 'anti_padding': anti_padding, 'sen_num': sen_num,
+            **gsf.allocation_summary(model, last_empl)}
+
+
+def run_in_pool(run, combinations, workers, initializer=None, initargs=(), progress=None, cancel=None):
+    """
+    Runs run(*combination) for every combination on a pool of worker processes, reporting progress (see sweep()) as
+    the runs finish
+    Returns a dictionary of combination: output of run, or None if cancel was set, in which case the runs in progress
+    are stopped rather than waited for
+    """
+    results = {}
+    # Worker processes are started fresh (spawn) rather than forked from the app, which has threads running
+    pool = multiprocessing.get_context('spawn').Pool(workers, initializer=initializer, initargs=initargs)
+    try:
+        pending = {combination: pool.apply_async(run, combination) for combination in combinations}
+        while pending:
+            if report_progress(progress, cancel, f'Finished {len(results)} of {len(combinations)} runs',
+                               len(results) / len(combinations)):
+                return None
+            next(iter(pending.values())).wait(0.25)
+            for combination in [combination for combination, result in pending.items() if result.ready()]:
+                results[combination] = pending.pop(combination).get()
+    finally:
+        # every run has finished, or the sweep was cancelled or failed and the runs left are not needed
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def sweep(route_list, seniority, charters, bid_list, force_reject_tuples=None, max_hours=(40,), anti_padding=(30,),
+          sen_num=(0,), engine='rounds', workers=None, progress=None, cancel=None, cache=None):
+    """
+    Runs gale_shapley_main() for every combination of the values given for max_hours, anti_padding and sen_num
+    (see gale_shapley_main() for the other arguments) and compares them
+    The inputs are read once, into one allocation model per anti_padding and sen_num, and the runs are spread over a
+    pool of worker processes (workers, one per core by default, 1 runs them all in this process)
+    progress: Optional function called with a message and the fraction of the runs done (0 to 1) as each run finishes
+    cancel: Optional threading.Event, once it is set the runs in progress are stopped and CANCELLED_MESSAGE is returned
+    cache: Optional stage_cache.StageCache the models are read through (a new one is used for this sweep otherwise)
+
+    Returns: DataFrame with one row per combination, in the order of the grid, of the parameters and the summary of
+        the allocation (see gsf.allocation_summary()), or an error message
+    """
+    grid = list(itertools.product(max_hours, anti_padding, sen_num))
+    if report_progress(progress, cancel, 'Reading input files', 0.0):
+        return CANCELLED_MESSAGE
+    # Read the inputs once, the stages shared by every model (charters, bids, ...) are only read for the first one
+    if cache is None:
+        cache = StageCache()
+    models = {}
+    for padding, start in dict.fromkeys((padding, start) for _, padding, start in grid):
+        model = prepare_model(route_list, seniority, charters, bid_list, padding, start, cache)
+        if isinstance(model, str):
+            return model
+        models[padding, start] = model
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(grid))
+    rows = {}
+    if workers <= 1:
+        init_sweep_worker(models, force_reject_tuples, engine)
+        for combination in grid:
+            if report_progress(progress, cancel, f'Finished {len(rows)} of {len(grid)} runs', len(rows) / len(grid)):
+                return CANCELLED_MESSAGE
+            rows[combination] = sweep_run(*combination)
+    else:
+        rows = run_in_pool(sweep_run, grid, workers, init_sweep_worker, (models, force_reject_tuples, engine), progress,
+                           cancel)
+        if rows is None:
+            return CANCELLED_MESSAGE
+    report_progress(progress, None, f'Finished {len(grid)} of {len(grid)} runs', 1.0)
+    return pd.DataFrame([rows[combination] for combination in grid])
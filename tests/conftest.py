@@ -0,0 +1,23 @@
+### Tests of the allocation, run from the repository root with: python -m pytest tests
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+@pytest.fixture
+def small_inputs():
+    """Routes, seniority, charters and bids of three drivers bidding on three charters, the second needs no buses"""
+    routes = pd.DataFrame({'Route identifier': [401], 'Employee': [11], 'Days of the week': ['M'],
+                           'Depot departure time': ['6:00 AM'], 'Depot return time': ['8:00 AM']})
+    seniority = pd.DataFrame({'FullName': ['A', 'B', 'C'], 'DriverID': [11, 12, 13], 'SeniorityNumber': [1, 2, 3]})
+    charters = pd.DataFrame({'Trip Number': [101, 102, 103], 'Buses': [1, 0, 1],
+                             'P/U Time': ['10:00:00'] * 3, 'Return Time': ['12:00:00'] * 3,
+                             'Trip Date': ['10/21/2024', '10/22/2024', '10/23/2024'],
+                             'Pick Up Location': ['School'] * 3, 'Destination': ['Place'] * 3})
+    bids = pd.DataFrame({'Id': [11, 12, 13], '1': [102, 101, 103], '2': [101, 102, 102], '3': [None, 103, None]})
+    return routes, seniority, charters, bids
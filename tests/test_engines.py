@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+
+import GS_Functions as gsf
+from outline import gale_shapley_main
+
+
+def engine_diagnostics(inputs, engine):
+    all_drivers, *_ = gale_shapley_main(*inputs, engine=engine)
+    return gsf.diagnostics_sheet(all_drivers)
+
+
+@pytest.mark.parametrize('engine', ['batched', 'serial'])
+def test_zero_bus_charter_diagnostics_match_rounds(small_inputs, engine):
+    expected = engine_diagnostics(small_inputs, 'rounds')
+    pd.testing.assert_frame_equal(engine_diagnostics(small_inputs, engine), expected)
+    # nobody was assigned the charter with no buses, so its bids are left undecided
+    assert (expected.loc[expected['RouteID'] == 102, 'Status'] == 'No Decision').all()
+
+
+def test_unknown_engine_is_rejected(small_inputs):
+    with pytest.raises(ValueError):
+        gale_shapley_main(*small_inputs, engine='Serial')
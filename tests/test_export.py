@@ -0,0 +1,36 @@
+import gzip
+import io
+
+import pandas as pd
+import pytest
+
+import GS_Functions as gsf
+from outline import gale_shapley_main
+
+
+@pytest.fixture
+def drivers(small_inputs):
+    all_drivers, *_ = gale_shapley_main(*small_inputs)
+    return all_drivers
+
+
+def test_csv_gz_chunks_make_one_file(drivers):
+    data = b''.join(gsf.export_diagnostics(drivers, 'csv.gz', chunk_size=2))
+    exported = pd.read_csv(io.BytesIO(gzip.decompress(data)))
+    assert exported['Status'].to_list() == gsf.diagnostics_sheet(drivers)['Status'].to_list()
+
+
+def test_parquet_chunks_make_one_file(drivers):
+    pq = pytest.importorskip('pyarrow.parquet')
+    # chunks of 2 bids, so the buffer is handed over and truncated several times
+    parts = list(gsf.export_diagnostics(drivers, 'parquet', chunk_size=2))
+    assert len(parts) > 2
+    exported = pq.read_table(io.BytesIO(b''.join(parts))).to_pandas()
+    expected = gsf.diagnostics_sheet(drivers).astype({'Status': str})
+    pd.testing.assert_frame_equal(exported, expected, check_dtype=False)
+
+
+def test_parquet_without_pyarrow_fails_before_writing(drivers, monkeypatch):
+    monkeypatch.setattr(gsf, 'parquet_available', lambda: False)
+    with pytest.raises(ImportError):
+        next(gsf.export_diagnostics(drivers, 'parquet'))
@@ -0,0 +1,35 @@
+import threading
+import time
+
+import pandas as pd
+
+from outline import gale_shapley_main
+from sweep import run_in_pool, sweep
+
+
+def slow_run(seconds):
+    """Run of run_in_pool() taking seconds, in a worker process"""
+    time.sleep(seconds)
+    return seconds
+
+
+def test_cancel_stops_runs_in_progress():
+    cancel = threading.Event()
+    start = time.perf_counter()
+
+    def progress(message, fraction):
+        # cancel once the workers have had time to start their runs
+        if time.perf_counter() - start > 3:
+            cancel.set()
+
+    results = run_in_pool(slow_run, [(60,), (60,), (60,)], workers=2, progress=progress, cancel=cancel)
+    assert results is None
+    assert time.perf_counter() - start < 20
+
+
+def test_pool_runs_match_single_runs(small_inputs):
+    result = sweep(*small_inputs, max_hours=(2, 40), workers=2)
+    assert isinstance(result, pd.DataFrame)
+    for row in result.to_dict('records'):
+        all_drivers, bids_assigned, *_ = gale_shapley_main(*small_inputs, max_hours=row['max_hours'])
+        assert row['Assigned Routes'] == sum(len(drivers) for drivers in bids_assigned.values())